@@ -3,285 +3,402 @@
 Relatório Técnico – Streamlit (Drive/GitHub + Shared Drives)
 """
 
-import io, os, base64, json, datetime as dt
+import os, json, time, uuid, mimetypes, datetime as dt
+from contextlib import ExitStack
+from dataclasses import asdict
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
 import streamlit as st
-from pydantic import BaseModel, Field
-
-# ===================== Modelos =====================
-class Autor(BaseModel):
-    nome: str = ""
-    cargo: str = ""
-    email: str = ""
-
-class Referencia(BaseModel):
-    referencia: str = ""
-
-class Anexo(BaseModel):
-    titulo: str = ""
-    descricao: str = ""
-    link: str = ""
-
-class Relatorio(BaseModel):
-    # Metadados
-    titulo: str = "Relatório Técnico"
-    cliente: str = ""
-    projeto: str = ""
-    codigo: str = ""  # será preenchido pelo gerador (opcional)
-    data: str = dt.date.today().isoformat()
-    versao: str = "1.0"
-    # Equipe
-    autores: List[Autor] = Field(default_factory=lambda: [Autor()])
-    aprovador: str = ""
-    # Corpo
-    resumo_exec: str = ""
-    escopo: str = ""
-    dados_fontes: str = ""
-    metodologia: str = ""
-    resultados: str = ""
-    discussoes: str = ""
-    conclusoes: str = ""
-    recomendacoes: str = ""
-    # Outros
-    referencias: List[Referencia] = Field(default_factory=list)
-    anexos: List[Anexo] = Field(default_factory=list)
-    observacoes: str = ""
-
-# ===================== Helpers =====================
-def to_markdown(r: Relatorio) -> str:
-    autores_md = "\n".join([f"- {a.nome} ({a.cargo}) <{a.email}>" for a in r.autores if a.nome.strip()])
-    refs_md = "\n".join([f"- {x.referencia}" for x in r.referencias if x.referencia.strip()])
-    anexos_md = "\n".join([
-        f"- **{a.titulo}** – {a.descricao} {(f'({a.link})' if a.link else '')}" for a in r.anexos if a.titulo.strip()
-    ])
-    parts = [
-        f"# {r.titulo}",
-        f"**Cliente:** {r.cliente}  ",
-        f"**Projeto:** {r.projeto}  ",
-        f"**Código:** {r.codigo}  ",
-        f"**Data:** {r.data}  ",
-        f"**Versão:** {r.versao}",
-        "\n---\n",
-        "## Autores",
-        autores_md or "(preencher)",
-        f"\n**Aprovador:** {r.aprovador or '(preencher)'}\n",
-        "\n## Resumo Executivo\n" + (r.resumo_exec or "(preencher)"),
-        "\n## Escopo\n" + (r.escopo or "(preencher)"),
-        "\n## Dados & Fontes\n" + (r.dados_fontes or "(preencher)"),
-        "\n## Metodologia\n" + (r.metodologia or "(preencher)"),
-        "\n## Resultados\n" + (r.resultados or "(preencher)"),
-        "\n## Discussões\n" + (r.discussoes or "(preencher)"),
-        "\n## Conclusões\n" + (r.conclusoes or "(preencher)"),
-        "\n## Recomendações\n" + (r.recomendacoes or "(preencher)"),
-        "\n## Referências\n" + (refs_md or "(preencher)"),
-        "\n## Anexos\n" + (anexos_md or "(preencher)"),
-        "\n## Observações\n" + (r.observacoes or ""),
-    ]
-    return "\n".join(parts)
-
-def get_logo_dims_cm(logo_bytes: bytes, width_cm: float) -> Tuple[float, float]:
-    from PIL import Image as PILImage
-    img = PILImage.open(io.BytesIO(logo_bytes))
-    w, h = img.size
-    if not w or not h:
-        return width_cm, width_cm * 0.5
-    ratio = h / w
-    return width_cm, width_cm * ratio
-
-# ===================== Exportadores =====================
-def build_pdf(r: Relatorio, logo_bytes: Optional[bytes], logo_width_cm: float) -> bytes:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.styles import getSampleStyleSheet
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage
-    from reportlab.lib.units import cm
-
-    buf = io.BytesIO()
-    doc = SimpleDocTemplate(buf, pagesize=A4, leftMargin=2*cm, rightMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
-    styles = getSampleStyleSheet()
-    story = []
-
-    def p(text: str, style="BodyText"):
-        story.append(Paragraph(text.replace("\n", "<br/>"), styles[style]))
-        story.append(Spacer(1, 0.3*cm))
-
-    if logo_bytes:
-        w_cm, h_cm = get_logo_dims_cm(logo_bytes, logo_width_cm)
-        story.append(RLImage(io.BytesIO(logo_bytes), width=w_cm*cm, height=h_cm*cm))
-        story.append(Spacer(1, 0.4*cm))
-
-    p(f"<b>{r.titulo}</b>", "Title")
-    p(
-        f"Cliente: <b>{r.cliente or '-'}</b><br/>"
-        f"Projeto: <b>{r.projeto or '-'}</b><br/>"
-        f"Código: <b>{r.codigo or '-'}</b><br/>"
-        f"Data: <b>{r.data or '-'}</b><br/>"
-        f"Versão: <b>{r.versao or '-'}</b>"
-    )
-
-    autores = "<br/>".join([f"- {a.nome} ({a.cargo}) &lt;{a.email}&gt;" for a in r.autores if a.nome.strip()]) or "(preencher)"
-    p(f"<b>Autores</b><br/>{autores}")
-    p(f"<b>Aprovador</b><br/>{r.aprovador or '(preencher)'}")
-
-    def sec(title, text):
-        p(f"<b>{title}</b>")
-        p(text or "(preencher)")
-
-    sec("Resumo Executivo", r.resumo_exec)
-    sec("Escopo", r.escopo)
-    sec("Dados & Fontes", r.dados_fontes)
-    sec("Metodologia", r.metodologia)
-    sec("Resultados", r.resultados)
-    sec("Discussões", r.discussoes)
-    sec("Conclusões", r.conclusoes)
-    sec("Recomendações", r.recomendacoes)
-
-    refs = "<br/>".join([f"- {x.referencia}" for x in r.referencias if x.referencia.strip()]) or "(preencher)"
-    p(f"<b>Referências</b><br/>{refs}")
-
-    anexos = "<br/>".join([
-        f"- <b>{a.titulo}</b> – {a.descricao} {(f'({a.link})' if a.link else '')}" for a in r.anexos if a.titulo.strip()
-    ]) or "(preencher)"
-    p(f"<b>Anexos</b><br/>{anexos}")
-
-    if r.observacoes:
-        sec("Observações", r.observacoes)
-
-    doc.build(story)
-    return buf.getvalue()
-
-def build_docx(r: Relatorio, logo_bytes: Optional[bytes], logo_width_cm: float) -> bytes:
-    from docx import Document
-    from docx.shared import Pt, Cm
-
-    doc = Document()
-    style = doc.styles["Normal"]
-    style.font.name = "Calibri"
-    style.font.size = Pt(11)
-
-    if logo_bytes:
-        section = doc.sections[0]
-        header = section.header
-        paragraph = header.paragraphs[0]
-        run = paragraph.add_run()
-        run.add_picture(io.BytesIO(logo_bytes), width=Cm(logo_width_cm))
-
-    doc.add_heading(r.titulo or "Relatório Técnico", level=0)
-
-    meta = doc.add_paragraph()
-    meta.add_run("Cliente: ").bold = True; meta.add_run(r.cliente or "-")
-    meta.add_run("\nProjeto: ").bold = True; meta.add_run(r.projeto or "-")
-    meta.add_run("\nCódigo: ").bold = True; meta.add_run(r.codigo or "-")
-    meta.add_run("\nData: ").bold = True; meta.add_run(r.data or "-")
-    meta.add_run("\nVersão: ").bold = True; meta.add_run(r.versao or "-")
-
-    doc.add_heading("Autores", level=1)
-    for a in r.autores:
-        if a.nome.strip():
-            doc.add_paragraph(f"- {a.nome} ({a.cargo}) <{a.email}>")
-    doc.add_paragraph(f"Aprovador: {r.aprovador or '(preencher)'}")
-
-    def sec(title, text):
-        doc.add_heading(title, level=1)
-        doc.add_paragraph(text or "(preencher)")
-
-    sec("Resumo Executivo", r.resumo_exec)
-    sec("Escopo", r.escopo)
-    sec("Dados & Fontes", r.dados_fontes)
-    sec("Metodologia", r.metodologia)
-    sec("Resultados", r.resultados)
-    sec("Discussões", r.discussoes)
-    sec("Conclusões", r.conclusoes)
-    sec("Recomendações", r.recomendacoes)
-
-    doc.add_heading("Referências", level=1)
-    if r.referencias:
-        for x in r.referencias:
-            if x.referencia.strip():
-                doc.add_paragraph(f"- {x.referencia}")
-    else:
-        doc.add_paragraph("(preencher)")
-
-    doc.add_heading("Anexos", level=1)
-    if r.anexos:
-        for a in r.anexos:
-            if a.titulo.strip():
-                line = f"- {a.titulo} – {a.descricao}"
-                if a.link:
-                    line += f" ({a.link})"
-                doc.add_paragraph(line)
-    else:
-        doc.add_paragraph("(preencher)")
-
-    if r.observacoes:
-        sec("Observações", r.observacoes)
-
-    bio = io.BytesIO()
-    doc.save(bio)
-    return bio.getvalue()
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from models import Autor, Referencia, Anexo, Relatorio
+from attachments import ATTACHMENTS_ENV, AttachmentStore, blob_lock, get_attachment_store, remote_name
+from exporters import (
+    EXPORT_MIMES, ExportResult, RenderCache, render_key, report_fingerprint, to_markdown, build_pdf, build_docx,
+    export_all, get_export_pool, attachment_label,
+)
+from codes import next_report_code
+from drafts import DraftStore, get_draft_store
+from jobs import DONE, FAILED, QUEUED, RUNNING, SUPERSEDED, JobFailed, JobQueue
+from cloud import (
+    DriveClient, UploadResult, UploadTask, get_drive_client, get_github_client, get_manifest,
+    run_uploads,
+)
+from metrics import Metrics, serve_metrics
+
+# ===================== Cache de renderização =====================
+def _secret_section(name: str) -> dict:
+    try:
+        return dict(st.secrets.get(name, {}))
+    except Exception:
+        return {}
+
+@st.cache_resource
+def get_render_cache() -> RenderCache:
+    # Orçamento configurável em st.secrets: [render_cache] max_mb = 64
+    max_mb = float(_secret_section("render_cache").get("max_mb", 64))
+    return RenderCache(max_bytes=int(max_mb * 1024 * 1024))
+
+def _measured(stage: str, render: Callable[[], bytes], metrics: Optional[Metrics]) -> Callable[[], bytes]:
+    metrics = metrics or get_metrics()
+    def run() -> bytes:
+        with metrics.timer(stage) as ev:
+            data = render()
+            ev["bytes"] = len(data)
+        return data
+    return run
+
+# `cache`/`metrics` explícitos permitem chamar de fora da thread do script (ex.: download sob demanda)
+def render_markdown(r: Relatorio, cache: Optional[RenderCache] = None, fingerprint: Optional[str] = None,
+                    metrics: Optional[Metrics] = None) -> bytes:
+    cache = cache or get_render_cache()
+    return cache.get_or_render(render_key("md", r, fingerprint=fingerprint),
+                               _measured("to_markdown", lambda: to_markdown(r).encode("utf-8"), metrics))
+
+def render_pdf(r: Relatorio, logo_bytes: Optional[bytes], logo_width_cm: float, cache: Optional[RenderCache] = None,
+               metrics: Optional[Metrics] = None) -> bytes:
+    cache = cache or get_render_cache()
+    key = render_key("pdf", r, logo_bytes, logo_width_cm)
+    return cache.get_or_render(key, _measured("build_pdf", lambda: build_pdf(r, logo_bytes, logo_width_cm), metrics))
+
+def render_docx(r: Relatorio, logo_bytes: Optional[bytes], logo_width_cm: float, cache: Optional[RenderCache] = None,
+                metrics: Optional[Metrics] = None) -> bytes:
+    cache = cache or get_render_cache()
+    key = render_key("docx", r, logo_bytes, logo_width_cm)
+    return cache.get_or_render(key, _measured("build_docx", lambda: build_docx(r, logo_bytes, logo_width_cm), metrics))
+
+def export_cached(r: Relatorio, logo_bytes: Optional[bytes], logo_width_cm: float,
+                  formats=("md", "pdf", "docx"), cache: Optional[RenderCache] = None,
+                  metrics: Optional[Metrics] = None, session: str = "") -> Dict[str, ExportResult]:
+    """Busca cada formato no cache e renderiza os que faltam em paralelo (pool de processos).
+
+    Cada formato é registrado em `metrics` (acertos de cache marcados como ``cached``).
+    """
+    cache = cache or get_render_cache()
+    metrics = metrics or get_metrics()
+    results: Dict[str, ExportResult] = {}
+    missing = []
+    for fmt in formats:
+        data = cache.lookup(render_key(fmt, r, logo_bytes, logo_width_cm))
+        if data is None:
+            missing.append(fmt)
+        else:
+            results[fmt] = ExportResult(fmt, data=data, cached=True)
+    if missing:
+        # Configurável em st.secrets: [export] workers = 3, timeout_s = 120
+        cfg = _secret_section("export")
+        pool = get_export_pool(int(cfg["workers"]) if cfg.get("workers") else None)
+        timeouts = {"pdf": float(cfg["timeout_s"]), "docx": float(cfg["timeout_s"])} if cfg.get("timeout_s") else None
+        for fmt, res in export_all(r, logo_bytes, logo_width_cm, missing, timeouts=timeouts, pool=pool).items():
+            if res.ok:
+                cache.put(render_key(fmt, r, logo_bytes, logo_width_cm), res.data)
+            results[fmt] = res
+    for fmt in formats:
+        res = results[fmt]
+        metrics.record(RENDER_STAGES[fmt], res.elapsed, len(res.data or b""), res.error, session=session, cached=res.cached)
+    return {fmt: results[fmt] for fmt in formats}
+
+# ===================== Métricas =====================
+RENDER_STAGES = {"md": "to_markdown", "pdf": "build_pdf", "docx": "build_docx"}
+
+@st.cache_resource
+def get_metrics() -> Metrics:
+    # Configurável em st.secrets: [metrics] log_path = "logs/metrics.jsonl", max_mb = 5, backups = 3,
+    # port = 9464 (padrão 0: sem endpoint), host = "127.0.0.1"
+    cfg = _secret_section("metrics")
+    metrics = Metrics(Path(cfg.get("log_path", Path.cwd() / "logs" / "metrics.jsonl")),
+                      max_bytes=int(float(cfg.get("max_mb", 5)) * 1024 * 1024), backups=int(cfg.get("backups", 3)))
+    port = int(cfg.get("port", 0))
+    if port:
+        try:
+            serve_metrics(metrics, port, cfg.get("host", "127.0.0.1"))
+        except OSError as e:  # porta ocupada (ex.: outra instância): segue sem endpoint
+            metrics.record("metrics_endpoint", 0.0, error=f"{type(e).__name__}: {e}")
+    return metrics
+
+# ===================== Anexos =====================
+@st.cache_resource
+def open_attachment_store() -> AttachmentStore:
+    # Configurável em st.secrets: [attachments] dir = "drafts/attachments" (um store para todos os relatórios)
+    root = Path(_secret_section("attachments").get("dir") or Path.cwd() / "drafts" / "attachments").resolve()
+    os.environ[ATTACHMENTS_ENV] = str(root)  # os processos do pool de exportação herdam
+    return get_attachment_store(str(root))
+
+def release_upload(up) -> None:
+    """Descarta o arquivo do gerenciador de uploads (em memória) depois de copiado para o store."""
+    ctx = get_script_run_ctx()
+    mgr = getattr(ctx, "uploaded_file_mgr", None)
+    if hasattr(mgr, "remove_file"):  # só o gerenciador em memória implementa
+        mgr.remove_file(session_id=ctx.session_id, file_id=up.file_id)
+
+def rerun_section() -> None:
+    """Reroda só o fragmento num rerun dele; numa execução completa, reroda o app."""
+    st.rerun(scope="fragment" if getattr(get_script_run_ctx(), "fragment_ids_this_run", None) else "app")
+
+def stored_attachments(rel: Relatorio) -> List[Anexo]:
+    """Um anexo por blob distinto (o mesmo arquivo em dois anexos sobe uma vez só)."""
+    store = open_attachment_store()
+    seen: Dict[str, Anexo] = {}
+    for a in rel.anexos:
+        if a.sha256 and a.sha256 not in seen and store.exists(a.sha256):
+            seen[a.sha256] = a
+    return list(seen.values())
 
 # ===================== Google Drive (inclui Shared Drives) =====================
-def get_drive_service():
+def drive_client(sa_info: dict) -> DriveClient:
+    # Configurável em st.secrets: [drive] chunk_mb = 8, resumable_threshold_mb = 5, api_endpoint = "..."
+    cfg = _secret_section("drive")
+    return get_drive_client(
+        sa_info,
+        api_endpoint=cfg.get("api_endpoint"),
+        chunk_size=int(float(cfg.get("chunk_mb", 8)) * 1024 * 1024),
+        resumable_threshold=int(float(cfg.get("resumable_threshold_mb", 5)) * 1024 * 1024),
+    )
+
+def get_drive_service() -> Optional[DriveClient]:
     try:
-        from google.oauth2.service_account import Credentials
-        from googleapiclient.discovery import build
-        scopes = ["https://www.googleapis.com/auth/drive.file"]
         sa_info = dict(st.secrets["gcp_service_account"])  # type: ignore
-        creds = Credentials.from_service_account_info(sa_info, scopes=scopes)
-        service = build("drive", "v3", credentials=creds)
-        return service
+        return drive_client(sa_info)
     except Exception as e:
         st.error(f"Drive não configurado: {e}")
         return None
 
-def drive_upload_bytes(service, folder_id: str, filename: str, data: bytes, mime: str) -> str:
-    from googleapiclient.http import MediaIoBaseUpload
-    import io as _io
-    file_metadata = {"name": filename, "parents": [folder_id]}
-    media = MediaIoBaseUpload(_io.BytesIO(data), mimetype=mime, resumable=False)
-    f = service.files().create(
-        body=file_metadata,
-        media_body=media,
-        fields="id, webViewLink",
-        supportsAllDrives=True,  # <— ESSENCIAL p/ Shared Drives
-    ).execute()
-    return f.get("webViewLink", "")
-
-# ===================== GitHub (opcional) =====================
-def github_upload_bytes(filename: str, data: bytes, message: str) -> str:
-    try:
-        gh = st.secrets.get("github", {})
-        token = gh.get("token"); repo = gh.get("repo"); branch = gh.get("branch", "main"); base_path = gh.get("base_path", "reports")
-        if not token or not repo:
-            raise RuntimeError("Token/Repo não configurados em st.secrets['github']")
-        url = f"https://api.github.com/repos/{repo}/contents/{base_path}/{filename}"
-        payload = {"message": message, "content": base64.b64encode(data).decode("utf-8"), "branch": branch}
-        import requests
-        r = requests.put(url, json=payload, headers={"Authorization": f"token {token}", "Accept": "application/vnd.github+json"}, timeout=30)
-        if r.status_code not in (200, 201):
-            raise RuntimeError(f"GitHub API: {r.status_code} – {r.text}")
-        j = r.json()
-        return j.get("content", {}).get("html_url", "") or j.get("content", {}).get("path", "")
-    except Exception as e:
-        st.error(f"GitHub upload falhou: {e}")
-        return ""
-
-# ===================== Código automático =====================
-COUNTER_FILE_DEFAULT = "counter.json"
-def next_report_code(prefix: str = "MavipeRTEC", draft_dir: Optional[str] = None) -> str:
-    pdir = Path(draft_dir) if draft_dir else Path.cwd() / "drafts"
-    pdir.mkdir(parents=True, exist_ok=True)
-    cfile = pdir / COUNTER_FILE_DEFAULT
-    counter = 0
-    if cfile.exists():
+# ===================== Upload automático =====================
+def upload_artifacts(artifacts, to_drive: bool, to_github: bool, manifest_dir: Optional[str] = None,
+                     attachments: Optional[List[Anexo]] = None, store: Optional[AttachmentStore] = None) -> List[UploadResult]:
+    """Monta as tarefas (artefato × destino) e envia tudo em paralelo.
+
+    Artefatos iguais ao último envio (segundo o manifesto local) são pulados; no
+    Drive, os que mudaram substituem o arquivo existente via ``files().update``.
+    Anexos sobem com nome derivado do hash (``anexo-<sha>.ext``), lidos do store
+    por mmap: cada blob é enviado uma única vez por destino, em qualquer relatório.
+    """
+    manifest = get_manifest(Path(manifest_dir or Path.cwd() / "drafts") / "upload_manifest.json")
+    attachments = attachments or []
+    store = store or (open_attachment_store() if attachments else None)
+    tasks: List[UploadTask] = []
+    skipped: List[UploadResult] = []
+    if to_drive:
+        folder_id = _secret_section("drive").get("folder_id")
+        if not folder_id:
+            raise RuntimeError("Defina [drive].folder_id em st.secrets.")
+        client = drive_client(_secret_section("gcp_service_account"))
+        # Chave do manifesto; cada closure abaixo fixa a sua no default (o GitHub usa gh_dest)
+        drive_dest = f"drive:{folder_id}"
+        for name, data, mime in artifacts:
+            entry = manifest.unchanged(drive_dest, name, data)
+            if entry:
+                skipped.append(UploadResult("drive", name, url=entry.get("url", ""), size=len(data), skipped=True))
+                continue
+            def upload(name=name, data=data, mime=mime, drive_dest=drive_dest):
+                prev = manifest.lookup(drive_dest, name) or {}
+                f = client.upload(folder_id, name, data, mime, file_id=prev.get("id"))
+                manifest.record(drive_dest, name, data, f.get("id", ""), f.get("webViewLink", ""))
+                return f.get("webViewLink", "")
+            tasks.append(UploadTask("drive", name, data, mime, upload))
+        for a in attachments:
+            name = remote_name(a.sha256, a.arquivo)
+            entry = manifest.unchanged(drive_dest, name, sha256=a.sha256)
+            if entry:
+                skipped.append(UploadResult("drive", name, url=entry.get("url", ""), size=a.tamanho, skipped=True))
+                continue
+            def upload_blob(name=name, a=a, drive_dest=drive_dest):
+                with blob_lock(f"{drive_dest}/{a.sha256}"):
+                    entry = manifest.unchanged(drive_dest, name, sha256=a.sha256)
+                    if entry:  # outro envio concorrente já subiu este blob
+                        return entry.get("url", "")
+                    with store.open(a.sha256) as mm:
+                        f = client.upload(folder_id, name, mm, a.mime or "application/octet-stream")
+                    manifest.record(drive_dest, name, remote_id=f.get("id", ""), url=f.get("webViewLink", ""), sha256=a.sha256)
+                    return f.get("webViewLink", "")
+            tasks.append(UploadTask("drive", name, b"", a.mime, upload_blob, size=a.tamanho))
+    if to_github:
+        # Todos os arquivos alterados num único commit
+        gh_cfg = _secret_section("github")
+        gh = get_github_client(gh_cfg)
+        gh_dest = f"github:{gh.repo}@{gh.branch}/{gh.base_path}"
+        files = []
+        for name, data, _ in artifacts:
+            entry = manifest.unchanged(gh_dest, name, data)
+            if entry:
+                skipped.append(UploadResult("github", name, url=entry.get("url", ""), size=len(data), skipped=True))
+            else:
+                files.append((name, data))
+        blobs = []
+        for a in attachments:
+            name = remote_name(a.sha256, a.arquivo)
+            entry = manifest.unchanged(gh_dest, name, sha256=a.sha256)
+            if entry:
+                skipped.append(UploadResult("github", name, url=entry.get("url", ""), size=a.tamanho, skipped=True))
+            else:
+                blobs.append((name, a))
+        if files or blobs:
+            names = ", ".join([name for name, _ in files] + [name for name, _ in blobs])
+            def publish(files=files, blobs=blobs, names=names, gh_dest=gh_dest):
+                with ExitStack() as stack:
+                    # Anexos entram no mesmo commit, lidos por mmap
+                    mapped = [(name, stack.enter_context(store.open(a.sha256))) for name, a in blobs]
+                    res = gh.publish(files + mapped, f"auto: {names}")
+                for name, data in files:
+                    manifest.record(gh_dest, name, data, res["commit"], res["url"])
+                for name, a in blobs:
+                    manifest.record(gh_dest, name, remote_id=res["commit"], url=res["url"], sha256=a.sha256)
+                return res["url"]
+            size = sum(len(data) for _, data in files) + sum(a.tamanho for _, a in blobs)
+            tasks.append(UploadTask("github", names, b"", "", publish, size=size))
+    # Configurável em st.secrets: [upload] workers = 4, retries = 3
+    cfg = _secret_section("upload")
+    return skipped + run_uploads(tasks, max_workers=int(cfg.get("workers", 4)), retries=int(cfg.get("retries", 3)))
+
+# ===================== Envio (autosave + exportação + upload) =====================
+def autosave_draft(rel: Relatorio, draft_dir: Optional[str], draft_id: str) -> Optional[int]:
+    """Grava só os campos alterados; devolve a nova revisão (None se nada mudou)."""
+    return get_draft_store(draft_dir).save(draft_id, rel.model_dump())
+
+@st.cache_resource
+def open_draft_store(draft_dir: str) -> DraftStore:
+    store = get_draft_store(draft_dir)
+    if store.count() == 0:  # primeira vez: traz os rascunhos .json antigos da pasta
+        store.import_json_dir(Path(draft_dir))
+    return store
+
+def artifact_base_name(rel: Relatorio, draft_id: Optional[str]) -> str:
+    """Nome dos artefatos enviados: o código ou, sem código, ``relatorio-<rascunho>``.
+
+    O manifesto é por nome: dois relatórios sem código chamados ``relatorio.*`` fariam
+    o segundo sobrescrever (``files().update``) os arquivos do primeiro no Drive.
+    """
+    if rel.codigo:
+        return rel.codigo.replace(" ", "_")
+    return f"relatorio-{(draft_id or uuid.uuid4().hex)[:8]}"
+
+def process_submission(rel: Relatorio, logo_bytes: Optional[bytes], logo_width_cm: float, options: dict,
+                       cache: Optional[RenderCache] = None, metrics: Optional[Metrics] = None) -> dict:
+    """Autosave, exportações e uploads, sem chamadas de UI (roda também em segundo plano).
+
+    Cada etapa é registrada em `metrics` (tempo, bytes, erro), na sessão ``options["session_id"]``.
+    Devolve ``{"saved", "autosave_error", "export_errors", "uploads"}`` (serializável em JSON).
+    """
+    metrics = metrics or get_metrics()
+    session = options.get("session_id", "")
+    t0 = time.perf_counter()
+    summary = {"saved": "", "autosave_error": "", "export_errors": {}, "uploads": []}
+    if options.get("autosave", True):
         try:
-            counter = json.loads(cfile.read_text(encoding="utf-8")).get("counter", 0)
-        except Exception:
-            pass
-    counter += 1
-    cfile.write_text(json.dumps({"counter": counter}, ensure_ascii=False, indent=2), encoding="utf-8")
-    return f"{prefix}{counter:03d}"
+            with metrics.timer("autosave", session=session):
+                rev = autosave_draft(rel, options.get("draft_dir"), options.get("draft_id") or rel.codigo or "relatorio")
+            summary["saved"] = f"rev {rev}" if rev else ""
+        except Exception as e:
+            summary["autosave_error"] = str(e)
+
+    # Exportações (MD/PDF/DOCX em paralelo; falha de um formato não bloqueia os outros)
+    uploading = options.get("to_drive", False) or options.get("to_github", False)
+    formats = ("md", "pdf", "docx") if uploading or not options.get("lazy_exports", True) else ("md",)
+    exports = export_cached(rel, logo_bytes, logo_width_cm, formats, cache=cache, metrics=metrics, session=session)
+    summary["export_errors"] = {fmt: res.error for fmt, res in exports.items() if not res.ok}
+
+    # Uploads automáticos (todos os arquivos × destinos em paralelo)
+    if uploading:
+        base_name = artifact_base_name(rel, options.get("draft_id"))
+        artifacts = [(f"{base_name}.json", json.dumps(rel.model_dump(), ensure_ascii=False, indent=2).encode("utf-8"), "application/json")]
+        artifacts += [(f"{base_name}.{fmt}", res.data, EXPORT_MIMES[fmt]) for fmt, res in exports.items() if res.ok]
+        results = upload_artifacts(artifacts, options.get("to_drive", False), options.get("to_github", False),
+                                   manifest_dir=options.get("draft_dir"), attachments=stored_attachments(rel))
+        summary["uploads"] = [asdict(u) for u in results]
+        for u in results:
+            metrics.record("upload", u.elapsed, 0 if u.skipped else u.size, u.error, destination=u.destination,
+                           session=session, cached=u.skipped, name=u.name, attempts=u.attempts)
+    failed = summary["autosave_error"] or summary["export_errors"] or any(u["error"] for u in summary["uploads"])
+    metrics.record("submission", time.perf_counter() - t0, error="falha em alguma etapa" if failed else "", session=session)
+    return summary
+
+def run_submission_job(payload: dict, blobs: Dict[str, bytes], cache: RenderCache, metrics: Metrics) -> dict:
+    """Handler da fila: falha (e é tentado de novo) se alguma etapa não concluiu."""
+    rel = Relatorio.model_validate(payload["rel"])
+    summary = process_submission(rel, blobs.get("logo"), payload.get("logo_width_cm", 3.5), payload["options"],
+                                 cache=cache, metrics=metrics)
+    failures = [f"autosave: {summary['autosave_error']}"] if summary["autosave_error"] else []
+    failures += [f"{fmt}: {err}" for fmt, err in summary["export_errors"].items()]
+    failures += [f"{u['destination']} {u['name']}: {u['error']}" for u in summary["uploads"] if u["error"]]
+    if failures:
+        raise JobFailed("; ".join(failures), summary)
+    return summary
+
+@st.cache_resource
+def get_job_queue(root: str) -> JobQueue:
+    # Uma fila por pasta de rascunhos; configurável em st.secrets: [jobs] workers = 2, max_attempts = 3
+    cfg = _secret_section("jobs")
+    cache, metrics = get_render_cache(), get_metrics()
+    return JobQueue(Path(root), lambda payload, blobs: run_submission_job(payload, blobs, cache, metrics),
+                    workers=int(cfg.get("workers", 2)), max_attempts=int(cfg.get("max_attempts", 3)))
+
+def show_submission(summary: dict, toast: bool = True) -> None:
+    """Resultado de um envio: autosave, erros de exportação e a tabela por artefato.
+
+    No painel de jobs (`toast=False`), o rascunho salvo vira uma legenda: o painel
+    reroda a cada poucos segundos e repetiria o toast.
+    """
+    if summary.get("saved"):
+        if toast:
+            st.toast(f"Rascunho salvo (local, {summary['saved']})", icon="💾")
+        else:
+            st.caption(f"💾 Rascunho salvo ({summary['saved']})")
+    if summary.get("autosave_error"):
+        st.warning(f"Autosave falhou: {summary['autosave_error']}")
+    for fmt, err in summary.get("export_errors", {}).items():
+        st.error(f"{fmt.upper()}: {err}")
+    uploads = summary.get("uploads", [])
+    if not uploads:
+        return
+    st.dataframe(
+        [{"Destino": u["destination"], "Arquivo": u["name"], "URL": u["url"], "Bytes": u["size"],
+          "Tempo (s)": round(u["elapsed"], 2), "Tentativas": u["attempts"],
+          "Status": "sem mudança" if u["skipped"] else ("erro" if u["error"] else "ok"), "Erro": u["error"]} for u in uploads],
+        use_container_width=True, hide_index=True,
+    )
+    for dest, label in (("drive", "Google Drive"), ("github", "GitHub")):
+        dest_results = [u for u in uploads if u["destination"] == dest]
+        if dest_results and not any(u["error"] for u in dest_results):
+            st.success(f"Upload automático → {label} concluído ✅")
+        elif dest_results:
+            st.error(f"{label} (auto): {sum(bool(u['error']) for u in dest_results)} arquivo(s) falharam")
+
+JOB_ICONS = {QUEUED: "⏳", RUNNING: "🔄", DONE: "✅", FAILED: "❌", SUPERSEDED: "⏭️"}
+
+@st.fragment(run_every="3s")
+def job_panel(queue: JobQueue) -> None:
+    c = queue.counts()
+    st.caption(f"Na fila: {c[QUEUED]} · Rodando: {c[RUNNING]} · Concluídos: {c[DONE]} · Falhos: {c[FAILED]} · Substituídos: {c[SUPERSEDED]}")
+    for job in queue.jobs(limit=8):
+        st.write(f"{JOB_ICONS[job['status']]} **{job['label']}** · {job['created'][11:19]} · tentativa {job['attempts']}/{job['max_attempts']}")
+        if job["error"]:
+            st.caption(job["error"][:300])
+        if job["status"] in (DONE, FAILED) and job.get("result"):
+            with st.expander("Detalhes do envio"):
+                show_submission(job["result"], toast=False)
+        if job["status"] == FAILED and st.button("Tentar de novo", key=f"retry-{job['id']}"):
+            queue.retry(job["id"])
+
+@st.fragment
+def metrics_panel(metrics: Metrics, session: str) -> None:
+    events = metrics.session_events(session)
+    if events:
+        st.dataframe(
+            [{"Hora": e["ts"][11:19], "Etapa": e["stage"], "Destino": e["destination"], "Tempo (s)": round(e["elapsed_s"], 3),
+              "KB": round(e["bytes"] / 1024, 1), "Cache": "✓" if e["cached"] else "", "Erro": e["error"]} for e in reversed(events)],
+            use_container_width=True, hide_index=True,
+        )
+    else:
+        st.caption("Nenhuma etapa registrada nesta sessão.")
+    st.caption("Agregado do processo (p50/p95):")
+    st.dataframe(
+        [{"Etapa": a["stage"], "Destino": a["destination"], "N": a["count"], "Erros": a["errors"],
+          "p50 (s)": round(a["p50_s"], 3), "p95 (s)": round(a["p95_s"], 3), "MB": round(a["bytes"] / 1024 / 1024, 2)}
+         for a in metrics.summary()],
+        use_container_width=True, hide_index=True,
+    )
+    st.button("Atualizar métricas")
 
 # ===================== UI =====================
 st.set_page_config(page_title="Relatório Técnico", page_icon="📝", layout="wide")
@@ -293,6 +410,11 @@ with st.sidebar:
     # Estado
     if "rel" not in st.session_state:
         st.session_state.rel = Relatorio()
+    if "draft_id" not in st.session_state:
+        st.session_state.draft_id = uuid.uuid4().hex
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    open_attachment_store()  # antes de qualquer exportação: define a pasta para o pool de processos
     rel: Relatorio = st.session_state.rel
 
     # Diagnóstico rápido (secrets)
@@ -306,11 +428,7 @@ with st.sidebar:
         try:
             svc = get_drive_service()
             fid = st.secrets["drive"]["folder_id"]
-            info = svc.files().get(
-                fileId=fid,
-                fields="id,name,mimeType",
-                supportsAllDrives=True
-            ).execute()
+            info = svc.get_metadata(fid)
             st.success(f"Acesso OK: {info['name']} ({info['mimeType']})")
         except Exception as e:
             st.error(f"Sem acesso: {e}")
@@ -319,9 +437,12 @@ with st.sidebar:
     st.subheader("Código automático")
     code_prefix = st.text_input("Prefixo", value=st.session_state.get("code_prefix","MavipeRTEC"))
     if st.button("🔢 Gerar código"):
-        rel.codigo = next_report_code(prefix=code_prefix)
-        st.session_state.rel = rel
-        st.success(f"Código: {rel.codigo}")
+        try:
+            rel.codigo = next_report_code(prefix=code_prefix)
+            st.session_state.rel = rel
+            st.success(f"Código: {rel.codigo}")
+        except Exception as e:
+            st.error(f"Não foi possível gerar o código: {e}")
 
     st.markdown("---")
     st.subheader("Rascunho local")
@@ -330,6 +451,28 @@ with st.sidebar:
     st.session_state.draft_dir = draft_dir
     autosave = st.checkbox("Autosave ao atualizar prévia", value=st.session_state.get("autosave", True))
     st.session_state.autosave = autosave
+    lazy_exports = st.checkbox("Gerar PDF/DOCX só ao baixar", value=st.session_state.get("lazy_exports", True))
+    st.session_state.lazy_exports = lazy_exports
+
+    # Busca/carregamento de rascunhos (índice SQLite)
+    try:
+        store = open_draft_store(draft_dir)
+        q = st.text_input("Buscar rascunho", placeholder="cliente, projeto, código ou título")
+        found = store.search(q, limit=50)
+        if found:
+            labels = {d["id"]: f"{d['codigo'] or '—'} · {d['cliente'] or '—'} · {d['projeto'] or '—'} · v{d['versao']} · {d['updated_at'][:16].replace('T', ' ')}" for d in found}
+            pick = st.selectbox("Rascunhos", list(labels), format_func=labels.get)
+            versions = store.history(pick)
+            vlabels = {v["rev"]: f"rev {v['rev']} · {v['saved_at'][:19].replace('T', ' ')} · {', '.join(v['fields'][:4])}{'…' if len(v['fields']) > 4 else ''}" for v in versions}
+            rev = st.selectbox("Versão", list(vlabels), format_func=vlabels.get)
+            if st.button("📂 Carregar rascunho"):
+                st.session_state.rel = Relatorio.model_validate(store.load(pick, None if rev == versions[0]["rev"] else rev))
+                st.session_state.draft_id = pick
+                st.rerun()
+        else:
+            st.caption("Nenhum rascunho encontrado.")
+    except Exception as e:
+        st.warning(f"Rascunhos indisponíveis: {e}")
 
     # Upload automático para cloud
     st.markdown("---")
@@ -338,10 +481,34 @@ with st.sidebar:
     st.session_state.auto_drive = auto_drive
     auto_gh = st.checkbox("GitHub (usar st.secrets)", value=st.session_state.get("auto_gh", False))
     st.session_state.auto_gh = auto_gh
+    background = st.checkbox("Processar em segundo plano", value=st.session_state.get("background", True),
+                             help="Autosave, exportação e upload rodam numa fila; o formulário não espera a rede.")
+    st.session_state.background = background
+
+    st.markdown("---")
+    st.subheader("Jobs")
+    job_panel(get_job_queue(str(Path(draft_dir) / "jobs")))
+
+    st.markdown("---")
+    with st.expander("⏱️ Métricas (tempo e tamanho por etapa)"):
+        metrics_panel(get_metrics(), st.session_state.session_id)
+
+    # Estatísticas do cache de renderização
+    st.markdown("---")
+    st.subheader("Cache de renderização")
+    cs = get_render_cache().stats()
+    st.caption(
+        f"Acertos: {cs['hits']} · Faltas: {cs['misses']} · Remoções: {cs['evictions']}  \n"
+        f"Itens: {cs['entries']} · {cs['bytes']/1024/1024:.1f} / {cs['max_bytes']/1024/1024:.0f} MB"
+    )
+
+# -------- Formulário (fragmentos) --------
+# Cada bloco é um fragmento: interagir com um deles reexecuta só aquele bloco, não o
+# script inteiro. Os campos gravam direto em st.session_state.rel.
 
-# -------- Form --------
-rel: Relatorio = st.session_state.rel
-with st.form("form"):
+@st.fragment
+def metadata_section() -> None:
+    rel: Relatorio = st.session_state.rel
     st.subheader("Metadados")
     c1,c2,c3,c4 = st.columns([2,2,1,1])
     rel.titulo  = c1.text_input("Título", rel.titulo)
@@ -352,6 +519,9 @@ with st.form("form"):
     rel.data   = d1.date_input("Data", dt.date.fromisoformat(rel.data) if rel.data else dt.date.today()).isoformat()
     rel.versao = d2.text_input("Versão", rel.versao)
 
+@st.fragment
+def team_section() -> None:
+    rel: Relatorio = st.session_state.rel
     st.subheader("Equipe")
     n = st.number_input("Nº de autores", 1, 10, max(1, len(rel.autores)), 1)
     while len(rel.autores) < n: rel.autores.append(Autor())
@@ -363,6 +533,9 @@ with st.form("form"):
         a.email = c3.text_input(f"Autor {i+1} – E-mail", a.email)
     rel.aprovador = st.text_input("Aprovador", rel.aprovador)
 
+@st.fragment
+def content_section() -> None:
+    rel: Relatorio = st.session_state.rel
     st.subheader("Conteúdo")
     rel.resumo_exec   = st.text_area("Resumo Executivo", rel.resumo_exec)
     rel.escopo        = st.text_area("Escopo", rel.escopo)
@@ -373,6 +546,9 @@ with st.form("form"):
     rel.conclusoes    = st.text_area("Conclusões", rel.conclusoes)
     rel.recomendacoes = st.text_area("Recomendações", rel.recomendacoes)
 
+@st.fragment
+def references_section() -> None:
+    rel: Relatorio = st.session_state.rel
     st.subheader("Referências & Anexos")
     nr = st.number_input("Nº de referências", 0, 50, len(rel.referencias), 1)
     while len(rel.referencias) < nr: rel.referencias.append(Referencia())
@@ -383,83 +559,115 @@ with st.form("form"):
     na = st.number_input("Nº de anexos", 0, 30, len(rel.anexos), 1)
     while len(rel.anexos) < na: rel.anexos.append(Anexo())
     while len(rel.anexos) > na: rel.anexos.pop()
+    store = open_attachment_store()
     for i,ax in enumerate(rel.anexos):
         c1,c2 = st.columns([2,3])
         ax.titulo = c1.text_input(f"Anexo {i+1} – Título", ax.titulo)
         ax.descricao = c2.text_input(f"Anexo {i+1} – Descrição", ax.descricao)
         ax.link = st.text_input(f"Anexo {i+1} – Link (opcional)", ax.link)
+        # A chave muda a cada arquivo guardado: o uploader volta vazio e o Streamlit
+        # não segura o arquivo na memória enquanto a sessão durar
+        gen = st.session_state.setdefault(f"anexo-file-gen-{i}", 0)
+        up = st.file_uploader(f"Anexo {i+1} – Arquivo (opcional)", key=f"anexo-file-{i}-{gen}")
+        if up is not None:
+            # Vai para o store em pedaços; o relatório guarda só nome, hash e tamanho
+            sha, size = store.put_stream(up)
+            ax.arquivo, ax.sha256, ax.tamanho = up.name, sha, size
+            ax.mime = up.type or mimetypes.guess_type(up.name)[0] or "application/octet-stream"
+            ax.titulo = ax.titulo or up.name
+            release_upload(up)
+            st.session_state[f"anexo-file-gen-{i}"] = gen + 1
+            rerun_section()
+        if ax.arquivo:
+            f1, f2 = st.columns([5,1])
+            f1.caption(f"📎 {attachment_label(ax)} · {ax.sha256[:12]}{'' if store.exists(ax.sha256) else ' · ⚠️ ausente do store'}")
+            if f2.button("Remover", key=f"anexo-rm-{i}"):
+                ax.arquivo, ax.sha256, ax.tamanho, ax.mime = "", "", 0, ""
+                st.rerun(scope="fragment")
 
     rel.observacoes = st.text_area("Observações (opcional)", rel.observacoes)
 
-    submitted = st.form_submit_button("Atualizar prévia")
-    if submitted:
-        st.session_state.rel = rel
-        # Autosave local
-        if st.session_state.get("autosave", True):
-            try:
-                p = Path(st.session_state.get("draft_dir", str(Path.cwd()/ "drafts")))
-                p.mkdir(parents=True, exist_ok=True)
-                name = f"{(rel.codigo or 'relatorio').replace(' ','_')}.json"
-                (p / name).write_text(json.dumps(rel.model_dump(), ensure_ascii=False, indent=2), encoding="utf-8")
-                st.toast("Rascunho salvo (local)", icon="💾")
-            except Exception as e:
-                st.warning(f"Autosave falhou: {e}")
-
-        # Exportações
-        logo_bytes = st.session_state.get("logo_bytes")
-        logo_width_cm = st.session_state.get("logo_width_cm", 3.5)
-        md_bytes  = to_markdown(rel).encode("utf-8")
-        pdf_bytes = build_pdf(rel, logo_bytes, logo_width_cm)
-        docx_bytes= build_docx(rel, logo_bytes, logo_width_cm)
-
-        # Uploads automáticos
-        base_name = (rel.codigo or "relatorio").replace(" ", "_")
-        if st.session_state.get("auto_drive", False):
-            try:
-                svc = get_drive_service()
-                folder_id = st.secrets.get("drive", {}).get("folder_id")
-                if not folder_id:
-                    raise RuntimeError("Defina [drive].folder_id em st.secrets.")
-                drive_upload_bytes(svc, folder_id, f"{base_name}.json", json.dumps(rel.model_dump(), ensure_ascii=False, indent=2).encode("utf-8"), "application/json")
-                drive_upload_bytes(svc, folder_id, f"{base_name}.md", md_bytes, "text/markdown")
-                drive_upload_bytes(svc, folder_id, f"{base_name}.pdf", pdf_bytes, "application/pdf")
-                drive_upload_bytes(svc, folder_id, f"{base_name}.docx", docx_bytes, "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
-                st.success("Upload automático → Google Drive concluído ✅")
-            except Exception as e:
-                st.error(f"Drive (auto): {e}")
-
-        if st.session_state.get("auto_gh", False):
-            try:
-                def gh_put(name, data):
-                    url = f"https://api.github.com/repos/{st.secrets['github']['repo']}/contents/{st.secrets['github'].get('base_path','reports')}/{name}"
-                    payload = {"message": f"auto: {name}", "content": base64.b64encode(data).decode("utf-8"), "branch": st.secrets['github'].get('branch','main')}
-                    import requests
-                    r = requests.put(url, json=payload, headers={"Authorization": f"token {st.secrets['github']['token']}", "Accept": "application/vnd.github+json"}, timeout=30)
-                    if r.status_code not in (200,201): raise RuntimeError(r.text)
-                gh_put(f"{base_name}.json", json.dumps(rel.model_dump(), ensure_ascii=False, indent=2).encode("utf-8"))
-                gh_put(f"{base_name}.md", md_bytes)
-                gh_put(f"{base_name}.pdf", pdf_bytes)
-                gh_put(f"{base_name}.docx", docx_bytes)
-                st.success("Upload automático → GitHub concluído ✅")
-            except Exception as e:
-                st.error(f"GitHub (auto): {e}")
-
-# Prévia + downloads
-st.subheader("Prévia (Markdown)")
-st.code(to_markdown(st.session_state.rel), language="markdown")
-
-colA, colB, colC = st.columns(3)
-md_bytes = to_markdown(st.session_state.rel).encode("utf-8")
-colA.download_button("⬇️ .md", md_bytes, file_name=f"{(st.session_state.rel.codigo or 'relatorio')}.md", mime="text/markdown", use_container_width=True)
-
-try:
-    pdf_bytes = build_pdf(st.session_state.rel, st.session_state.get("logo_bytes"), st.session_state.get("logo_width_cm", 3.5))
-    colB.download_button("⬇️ PDF", pdf_bytes, file_name=f"{(st.session_state.rel.codigo or 'relatorio')}.pdf", mime="application/pdf", use_container_width=True)
-except Exception as e:
-    colB.error(f"PDF: {e}")
-
-try:
-    docx_bytes = build_docx(st.session_state.rel, st.session_state.get("logo_bytes"), st.session_state.get("logo_width_cm", 3.5))
-    colC.download_button("⬇️ DOCX", docx_bytes, file_name=f"{(st.session_state.rel.codigo or 'relatorio')}.docx", mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document", use_container_width=True)
-except Exception as e:
-    colC.error(f"DOCX: {e}")
+def submit_report(rel: Relatorio) -> None:
+    """Autosave + exportação + upload do relatório atual (em segundo plano ou aqui mesmo)."""
+    logo_bytes = st.session_state.get("logo_bytes")
+    logo_width_cm = st.session_state.get("logo_width_cm", 3.5)
+    options = {
+        "autosave": st.session_state.get("autosave", True),
+        "draft_dir": st.session_state.get("draft_dir"),
+        "draft_id": st.session_state.get("draft_id"),
+        "lazy_exports": st.session_state.get("lazy_exports", True),
+        "to_drive": st.session_state.get("auto_drive", False),
+        "to_github": st.session_state.get("auto_gh", False),
+        "session_id": st.session_state.get("session_id", ""),
+    }
+    queue = get_job_queue(str(Path(options["draft_dir"] or Path.cwd() / "drafts") / "jobs"))
+    # Um envio por rascunho: o novo substitui os jobs pendentes (e novas tentativas) do anterior
+    if st.session_state.get("background", True):
+        queue.submit((rel.codigo or "relatorio"), {"rel": rel.model_dump(), "logo_width_cm": logo_width_cm, "options": options},
+                     blobs={"logo": logo_bytes} if logo_bytes else None, key=options["draft_id"] or "")
+        st.toast("Envio enfileirado (segundo plano)", icon="📤")
+    else:
+        if options["draft_id"]:
+            queue.supersede(options["draft_id"])
+        with st.spinner("Salvando, exportando e enviando..."):
+            summary = process_submission(rel, logo_bytes, logo_width_cm, options)
+        show_submission(summary)
+
+def preview_snapshot(rel: Relatorio) -> Tuple[Relatorio, str, bytes]:
+    """Cópia congelada do relatório, seu hash e o Markdown; só recalcula se o conteúdo mudou."""
+    fp = report_fingerprint(rel)
+    cached = st.session_state.get("preview")
+    if cached is None or cached[1] != fp:
+        # Cópia: os fragmentos do formulário alteram st.session_state.rel in-place
+        snapshot = rel.model_copy(deep=True)
+        cached = st.session_state.preview = (snapshot, fp, render_markdown(snapshot, fingerprint=fp))
+    return cached
+
+@st.fragment
+def preview_section() -> None:
+    rel: Relatorio = st.session_state.rel
+    if st.button("Atualizar prévia", type="primary"):
+        submit_report(rel)
+
+    st.subheader("Prévia (Markdown)")
+    snapshot, fp, md_bytes = preview_snapshot(rel)
+    st.code(md_bytes.decode("utf-8"), language="markdown")
+
+    base_name = (snapshot.codigo or "relatorio")
+    logo_bytes = st.session_state.get("logo_bytes")
+    logo_width_cm = st.session_state.get("logo_width_cm", 3.5)
+    lazy = st.session_state.get("lazy_exports", True)
+    cache, metrics = get_render_cache(), get_metrics()
+
+    if lazy and st.button("⚙️ Preparar exportações"):
+        for res in export_cached(snapshot, logo_bytes, logo_width_cm, ("pdf", "docx"),
+                                 session=st.session_state.get("session_id", "")).values():
+            if not res.ok:
+                st.error(f"{res.fmt.upper()}: {res.error}")
+
+    colA, colB, colC = st.columns(3)
+    colA.download_button("⬇️ .md", md_bytes, file_name=f"{base_name}.md", mime="text/markdown", use_container_width=True)
+
+    for col, fmt, render, mime in (
+        (colB, "pdf", render_pdf, "application/pdf"),
+        (colC, "docx", render_docx, "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    ):
+        label = f"⬇️ {fmt.upper()}"
+        if lazy:
+            # Gerado só quando o download é pedido (em outra thread, via cache)
+            def data(render=render):
+                return render(snapshot, logo_bytes, logo_width_cm, cache=cache, metrics=metrics)
+            col.download_button(label, data, file_name=f"{base_name}.{fmt}", mime=mime, use_container_width=True)
+            ready = cache.contains(render_key(fmt, snapshot, logo_bytes, logo_width_cm, fingerprint=fp))
+            col.caption("✅ em cache" if ready else "⏳ desatualizado – gera ao baixar")
+            continue
+        try:
+            col.download_button(label, render(snapshot, logo_bytes, logo_width_cm, cache=cache, metrics=metrics), file_name=f"{base_name}.{fmt}", mime=mime, use_container_width=True)
+        except Exception as e:
+            col.error(f"{fmt.upper()}: {e}")
+
+metadata_section()
+team_section()
+content_section()
+references_section()
+preview_section()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Anexos em disco endereçados por conteúdo (sha256), deduplicados entre relatórios
+"""
+
+import os, mmap, hashlib, tempfile, threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple, Union
+
+CHUNK_SIZE = 1024 * 1024
+# Pasta do store compartilhado; também lida pelos processos do pool de exportação
+ATTACHMENTS_ENV = "RELATORIO_ATTACHMENTS_DIR"
+
+class AttachmentStore:
+    """Blobs imutáveis em ``root/objects/<2 primeiros hex>/<sha256>``.
+
+    A gravação é em streaming (pedaços de `chunk_size`, com hash incremental) para
+    um temporário na mesma pasta e termina num rename atômico; se o blob já existe,
+    o temporário é descartado. A leitura é por mmap, sem carregar o arquivo inteiro.
+    """
+
+    def __init__(self, root: Path, chunk_size: int = CHUNK_SIZE):
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+        (self.root / "objects").mkdir(parents=True, exist_ok=True)
+        (self.root / "tmp").mkdir(exist_ok=True)
+
+    def path(self, sha256: str) -> Path:
+        return self.root / "objects" / sha256[:2] / sha256
+
+    def exists(self, sha256: str) -> bool:
+        return bool(sha256) and self.path(sha256).exists()
+
+    def put_stream(self, fh: BinaryIO) -> Tuple[str, int]:
+        """Copia `fh` para o store; devolve (sha256, tamanho)."""
+        h, size = hashlib.sha256(), 0
+        fd, tmp = tempfile.mkstemp(dir=self.root / "tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = fh.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    h.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+                out.flush()
+                os.fsync(out.fileno())
+            sha = h.hexdigest()
+            dest = self.path(sha)
+            if dest.exists():  # mesmo conteúdo já guardado (por este ou outro relatório)
+                os.unlink(tmp)
+            else:
+                dest.parent.mkdir(exist_ok=True)
+                os.replace(tmp, dest)
+            return sha, size
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    @contextmanager
+    def open(self, sha256: str) -> Iterator[Union[mmap.mmap, bytes]]:
+        """Mapeia o blob na memória (somente leitura). Arquivos vazios viram ``b""``."""
+        with open(self.path(sha256), "rb") as fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                yield b""
+                return
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield mm
+            finally:
+                mm.close()
+
+_stores: Dict[str, AttachmentStore] = {}
+_stores_lock = threading.Lock()
+
+def get_attachment_store(root: Optional[str] = None) -> AttachmentStore:
+    """Um store por pasta (padrão: $RELATORIO_ATTACHMENTS_DIR ou ./drafts/attachments)."""
+    path = Path(root or os.environ.get(ATTACHMENTS_ENV) or Path.cwd() / "drafts" / "attachments")
+    key = str(path.resolve())
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = AttachmentStore(path)
+        return _stores[key]
+
+def remote_name(sha256: str, filename: str) -> str:
+    """Nome no destino (Drive/GitHub): o hash define o arquivo, então cada blob sobe uma vez só."""
+    ext = Path(filename).suffix.lower()
+    return f"anexo-{sha256[:16]}{ext}"
+
+_blob_locks: Dict[str, threading.Lock] = {}
+
+def blob_lock(key: str) -> threading.Lock:
+    """Lock por blob/destino: envios concorrentes do mesmo blob esperam o primeiro terminar."""
+    with _stores_lock:
+        return _blob_locks.setdefault(key, threading.Lock())
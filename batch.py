@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Gerador de relatórios em lote (sem Streamlit)
+
+Exemplos:
+    python batch.py drafts/ --out saida.zip
+    python batch.py drafts/drafts.db --out saida.zip
+    python batch.py relatorios.jsonl --out saida/ --formats pdf,docx --workers 8
+    cat relatorios.jsonl | python batch.py - --out saida.zip --logo logo.png
+"""
+
+import os, re, sys, json, time, zipfile, argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from attachments import ATTACHMENTS_ENV
+from exporters import Logo, prepare_logo, render_format
+from models import Relatorio
+
+FORMATS = ("md", "pdf", "docx")
+
+# ===================== Entrada =====================
+def iter_records(source: str) -> Iterator[Tuple[str, object]]:
+    """(nome, registro) de uma pasta de *.json, de um arquivo .jsonl/.json (objeto ou
+    lista de objetos), de um drafts.db (SQLite) ou de stdin ("-")."""
+    if source == "-":
+        yield from _iter_jsonl(sys.stdin, "stdin")
+        return
+    path = Path(source)
+    if path.is_dir():
+        for f in sorted(path.glob("*.json")):
+            try:
+                doc = json.loads(f.read_text(encoding="utf-8"))
+            except ValueError as e:
+                yield f.stem, e
+                continue
+            if isinstance(doc, dict) and "titulo" in doc:  # ignora counter.json, manifestos etc.
+                yield f.stem, doc
+    elif path.suffix == ".db":
+        from drafts import DraftStore
+        yield from DraftStore(path).iter_drafts()
+    elif path.suffix == ".json":
+        try:
+            doc = json.loads(path.read_text(encoding="utf-8"))
+        except ValueError as e:
+            yield path.stem, e
+            return
+        if isinstance(doc, list):  # um arquivo com vários relatórios
+            for n, item in enumerate(doc, 1):
+                yield f"{path.stem}-{n}", item
+        else:
+            yield path.stem, doc
+    else:
+        with open(path, encoding="utf-8") as fh:
+            yield from _iter_jsonl(fh, path.stem)
+
+def _iter_jsonl(fh, stem: str) -> Iterator[Tuple[str, object]]:
+    for n, line in enumerate(fh, 1):
+        if not line.strip():
+            continue
+        try:
+            yield f"{stem}-{n}", json.loads(line)
+        except ValueError as e:
+            yield f"{stem}-{n}", e
+
+# ===================== Saída =====================
+def safe_name(name: str) -> str:
+    """Nome de arquivo sem separadores nem ``..`` (``RT/01`` → ``RT_01``)."""
+    name = re.sub(r"[\\/:\s]+", "_", name).replace("..", "_").strip("._")
+    return name or "relatorio"
+
+class Output:
+    """Grava os arquivos numa pasta ou num .zip, à medida que ficam prontos."""
+
+    def __init__(self, target: str):
+        self.zip = zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) if target.endswith(".zip") else None
+        self.dir = None if self.zip else Path(target)
+        if self.dir:
+            self.dir.mkdir(parents=True, exist_ok=True)
+        self._names: Dict[str, int] = {}
+
+    def unique(self, base: str) -> str:
+        base = safe_name(base)
+        n = self._names.get(base, 0)
+        self._names[base] = n + 1
+        return base if n == 0 else f"{base}_{n + 1}"
+
+    def write(self, name: str, data: bytes) -> None:
+        if self.zip:
+            # PDF/DOCX já são comprimidos: não vale gastar CPU de novo
+            compress = zipfile.ZIP_STORED if name.endswith((".pdf", ".docx")) else zipfile.ZIP_DEFLATED
+            self.zip.writestr(name, data, compress_type=compress)
+        else:
+            (self.dir / name).write_bytes(data)
+
+    def close(self) -> None:
+        if self.zip:
+            self.zip.close()
+
+# ===================== Renderização (processos filhos) =====================
+_logo: Optional[Logo] = None
+_logo_width_cm = 3.5
+
+def _init_worker(logo: Optional[Logo], logo_width_cm: float) -> None:
+    # O logo vai uma vez para cada processo, não junto com cada relatório
+    global _logo, _logo_width_cm
+    _logo, _logo_width_cm = logo, logo_width_cm
+
+def _render_record(doc: dict, formats: Tuple[str, ...]) -> Tuple[Dict[str, bytes], Dict[str, str], float]:
+    t0 = time.perf_counter()
+    r = Relatorio.model_validate(doc)
+    out, errors = {}, {}
+    for fmt in formats:
+        try:
+            out[fmt] = render_format(fmt, r, _logo, _logo_width_cm)
+        except Exception as e:
+            errors[fmt] = f"{type(e).__name__}: {e}"
+    return out, errors, time.perf_counter() - t0
+
+# ===================== Lote =====================
+def run_batch(source: str, target: str, formats: Tuple[str, ...] = FORMATS, workers: Optional[int] = None,
+              logo_bytes: Optional[bytes] = None, logo_width_cm: float = 3.5, log=print) -> dict:
+    """Valida e renderiza todos os registros num pool de processos, gravando à medida que terminam."""
+    workers = workers or os.cpu_count() or 1
+    out = Output(target)
+    stats = {"reports": 0, "ok": 0, "invalid": 0, "failed": 0, "files": 0, "bytes": 0, "cpu_s": 0.0}
+    failures: List[Tuple[str, str]] = []
+    t0 = time.perf_counter()
+    pending = {}
+
+    def collect(done):
+        for fut in done:
+            name = pending.pop(fut)
+            try:
+                files, errors, cpu = fut.result()
+            except Exception as e:
+                files, errors, cpu = {}, {"*": f"{type(e).__name__}: {e}"}, 0.0
+            stats["cpu_s"] += cpu
+            for fmt, data in files.items():
+                out.write(f"{name}.{fmt}", data)
+                stats["files"] += 1
+                stats["bytes"] += len(data)
+            if errors:
+                stats["failed"] += 1
+                failures.extend((f"{name}.{fmt}", err) for fmt, err in errors.items())
+            else:
+                stats["ok"] += 1
+
+    logo: Optional[Logo] = logo_bytes
+    if logo_bytes:
+        try:  # reduzido uma vez aqui, não em cada processo
+            logo = prepare_logo(logo_bytes, logo_width_cm)
+        except Exception:
+            pass  # imagem inválida: cada registro reporta o erro
+
+    def new_pool() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(logo, logo_width_cm))
+
+    pool = new_pool()
+    try:
+        for stem, record in iter_records(source):
+            stats["reports"] += 1
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                doc = Relatorio.model_validate(record).model_dump()
+            except (ValidationError, ValueError) as e:
+                stats["invalid"] += 1
+                failures.append((stem, f"inválido: {e}"))
+                continue
+            name = out.unique(doc.get("codigo") or stem)
+            try:
+                fut = pool.submit(_render_record, doc, formats)
+            except BrokenProcessPool:
+                # Um processo morreu (OOM, segfault): os pendentes contam como falha
+                # (em collect) e o lote segue num pool novo
+                collect(list(pending))
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = new_pool()
+                fut = pool.submit(_render_record, doc, formats)
+            pending[fut] = name
+            # Limita o que está em voo: memória constante mesmo com milhares de registros
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        out.close()
+
+    stats["elapsed_s"] = time.perf_counter() - t0
+    stats["failures"] = failures
+    elapsed = max(stats["elapsed_s"], 1e-9)
+    log(f"{stats['reports']} relatórios em {elapsed:.1f}s ({stats['reports'] / elapsed:.1f}/s, {workers} processos, "
+        f"uso de CPU {stats['cpu_s'] / elapsed:.1f}×): {stats['ok']} ok, {stats['failed']} com falha, {stats['invalid']} inválidos; "
+        f"{stats['files']} arquivos, {stats['bytes'] / 1024 / 1024:.1f} MB → {target}")
+    for name, err in failures:
+        first = next((line for line in err.splitlines() if line.strip()), err)
+        log(f"  ✗ {name}: {first[:200]}")
+    return stats
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Gera MD/PDF/DOCX em lote a partir de rascunhos JSON.")
+    ap.add_argument("source", help="pasta com *.json, arquivo .jsonl/.json, drafts.db, ou - para JSONL via stdin")
+    ap.add_argument("--out", required=True, help="pasta de saída ou arquivo .zip")
+    ap.add_argument("--formats", default=",".join(FORMATS), help="lista separada por vírgula (md,pdf,docx)")
+    ap.add_argument("--workers", type=int, default=None, help="processos (padrão: nº de CPUs)")
+    ap.add_argument("--logo", help="imagem do logo (PNG/JPG)")
+    ap.add_argument("--logo-width-cm", type=float, default=3.5)
+    ap.add_argument("--attachments", help="pasta do store de anexos (padrão: ./drafts/attachments)")
+    args = ap.parse_args(argv)
+
+    formats = tuple(f.strip() for f in args.formats.split(",") if f.strip())
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        ap.error(f"formato desconhecido: {', '.join(sorted(unknown))}")
+    logo = Path(args.logo).read_bytes() if args.logo else None
+    if args.attachments:  # os processos filhos herdam
+        os.environ[ATTACHMENTS_ENV] = str(Path(args.attachments).resolve())
+    stats = run_batch(args.source, args.out, formats, args.workers, logo, args.logo_width_cm)
+    return 0 if not stats["failures"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks dos exportadores e do modelo (tempo, pico de memória e tamanho da saída)
+
+Exemplos:
+    python bench.py                          # roda tudo e compara com bench_baseline.json
+    python bench.py --quick                  # só os tamanhos pequenos/médios
+    python bench.py --filter pdf --repeat 5
+    python bench.py --save-baseline          # grava os resultados como nova linha de base
+"""
+
+import io, sys, json, time, random, argparse, platform, statistics, tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from models import Anexo, Autor, Referencia, Relatorio
+from exporters import build_docx, build_pdf, clear_image_cache, get_logo_dims_cm, to_markdown
+
+BASELINE_DEFAULT = Path(__file__).with_name("bench_baseline.json")
+# Quanto pode piorar em relação à linha de base antes de contar como regressão
+THRESHOLDS = {"time_s": 0.25, "peak_mb": 0.25, "out_kb": 0.10}
+
+# ===================== Dados sintéticos =====================
+# nome: (caracteres por seção, autores, referências, anexos)
+SIZES = {
+    "tiny": (200, 1, 0, 0),
+    "small": (5_000, 3, 5, 3),
+    "medium": (50_000, 5, 20, 10),
+    "large": (500_000, 10, 50, 30),
+    "huge": (2_000_000, 10, 50, 30),
+}
+QUICK = ("tiny", "small", "medium")
+LOGOS_KB = (10, 100, 1_000, 10_000)
+
+SECTIONS = ("resumo_exec", "escopo", "dados_fontes", "metodologia", "resultados", "discussoes", "conclusoes", "recomendacoes")
+
+def synthetic_text(chars: int, rng: random.Random) -> str:
+    """Parágrafos de palavras pseudoaleatórias (reprodutível pela semente)."""
+    words = ("dados", "análise", "modelo", "resultado", "campo", "amostra", "taxa", "média", "região", "sensor",
+             "medição", "índice", "série", "tendência", "relatório", "método", "erro", "valor", "área", "período")
+    out, size = [], 0
+    while size < chars:
+        para = " ".join(rng.choice(words) for _ in range(rng.randint(40, 120))).capitalize() + "."
+        out.append(para)
+        size += len(para) + 2
+    return "\n\n".join(out)[:chars]
+
+def synthetic_report(size: str, seed: int = 42) -> Relatorio:
+    chars, n_autores, n_refs, n_anexos = SIZES[size]
+    rng = random.Random(seed)
+    return Relatorio(
+        titulo=f"Relatório sintético ({size})",
+        cliente="Cliente Exemplo S.A.", projeto="Projeto Benchmark", codigo=f"BENCH-{size.upper()}",
+        data="2026-01-01", versao="1.0",
+        autores=[Autor(nome=f"Autor {i}", cargo="Analista", email=f"autor{i}@exemplo.com") for i in range(n_autores)],
+        aprovador="Aprovador Exemplo",
+        **{s: synthetic_text(chars // len(SECTIONS), rng) for s in SECTIONS},
+        referencias=[Referencia(referencia=f"Referência {i}: {synthetic_text(120, rng)}") for i in range(n_refs)],
+        anexos=[Anexo(titulo=f"Anexo {i}", descricao=synthetic_text(80, rng), link=f"https://exemplo.com/anexo/{i}") for i in range(n_anexos)],
+        observacoes=synthetic_text(min(chars, 2_000), rng),
+    )
+
+def synthetic_logo(kb: int, seed: int = 7) -> bytes:
+    """PNG de ruído (incompressível), com ~`kb` KB."""
+    from PIL import Image
+    side = max(8, int((kb * 1024 / 3) ** 0.5))
+    img = Image.frombytes("RGB", (side, side), random.Random(seed).randbytes(side * side * 3))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
+
+# ===================== Medição =====================
+def measure(fn: Callable[[], object], repeat: int, budget_s: float = 60.0) -> Dict[str, Optional[float]]:
+    """Mediana do tempo de parede em até `repeat` execuções e pico de memória Python
+    (tracemalloc) numa execução extra.
+
+    Casos lentos param de repetir ao estourar `budget_s`; se uma única execução já
+    estoura, o pico de memória não é medido (fica None) para não dobrar o tempo.
+    """
+    times: List[float] = []
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+        if sum(times) > budget_s:
+            break
+    peak = None
+    if times[0] <= budget_s:
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        finally:
+            tracemalloc.stop()
+    size = len(out) if isinstance(out, (bytes, str)) else 0
+    return {"time_s": statistics.median(times), "peak_mb": peak, "out_kb": size / 1024}
+
+def cases(sizes: Tuple[str, ...], logos_kb: Tuple[int, ...]) -> List[Tuple[str, Callable[[], object]]]:
+    out: List[Tuple[str, Callable[[], object]]] = []
+    for size in sizes:
+        r = synthetic_report(size)
+        doc = r.model_dump()
+        out += [
+            (f"model_validate/{size}", lambda doc=doc: Relatorio.model_validate(doc)),
+            (f"model_dump/{size}", lambda r=r: r.model_dump()),
+            (f"to_markdown/{size}", lambda r=r: to_markdown(r)),
+            (f"build_pdf/{size}", lambda r=r: build_pdf(r, None, 3.5)),
+            (f"build_docx/{size}", lambda r=r: build_docx(r, None, 3.5)),
+        ]
+    r = synthetic_report("small")
+    for kb in logos_kb:
+        logo = synthetic_logo(kb)
+        out += [
+            # Frio: o cache de imagens é limpo a cada execução (primeiro envio de um logo novo)
+            (f"get_logo_dims_cm/{kb}KB", lambda logo=logo: cold(get_logo_dims_cm, logo, 3.5)),
+            (f"build_pdf/small+logo{kb}KB", lambda logo=logo: cold(build_pdf, r, logo, 3.5)),
+            (f"build_docx/small+logo{kb}KB", lambda logo=logo: cold(build_docx, r, logo, 3.5)),
+            # Quente: o logo já preparado (envios seguintes da mesma sessão/processo)
+            (f"build_pdf/small+logo{kb}KB/cache", lambda logo=logo: build_pdf(r, logo, 3.5)),
+        ]
+    return out
+
+def cold(fn: Callable[..., object], *args) -> object:
+    clear_image_cache()
+    return fn(*args)
+
+# ===================== Linha de base =====================
+def compare(results: Dict[str, Dict[str, Optional[float]]], baseline: Dict[str, Dict[str, Optional[float]]],
+            thresholds: Dict[str, float] = THRESHOLDS) -> List[str]:
+    """Regressões: métricas acima de (1 + limite) × linha de base.
+
+    Tempos muito curtos (< 5 ms) são ignorados: o ruído domina.
+    """
+    regressions = []
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric, limit in thresholds.items():
+            b, c = base.get(metric), cur.get(metric)
+            if b is None or c is None or (metric == "time_s" and b < 0.005):
+                continue
+            if b > 0 and c > b * (1 + limit):
+                regressions.append(f"{name} {metric}: {b:.4g} → {c:.4g} (+{(c / b - 1) * 100:.0f}%, limite {limit * 100:.0f}%)")
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmarks dos exportadores e do modelo.")
+    ap.add_argument("--quick", action="store_true", help=f"só {', '.join(QUICK)} e logos até 1 MB")
+    ap.add_argument("--filter", default="", help="roda só os casos cujo nome contém este texto")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--budget", type=float, default=60.0, help="segundos por caso antes de parar de repetir")
+    ap.add_argument("--baseline", type=Path, default=BASELINE_DEFAULT)
+    ap.add_argument("--save-baseline", action="store_true", help="grava os resultados em --baseline")
+    args = ap.parse_args(argv)
+
+    sizes = QUICK if args.quick else tuple(SIZES)
+    logos = tuple(kb for kb in LOGOS_KB if kb <= 1_000) if args.quick else LOGOS_KB
+    baseline = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8")).get("results", {})
+
+    results: Dict[str, Dict[str, Optional[float]]] = {}
+    print(f"{'caso':<34} {'tempo (s)':>10} {'pico (MB)':>10} {'saída (KB)':>11} {'vs base':>9}")
+    for name, fn in cases(sizes, logos):
+        if args.filter and args.filter not in name:
+            continue
+        m = results[name] = measure(fn, args.repeat, args.budget)
+        base = baseline.get(name, {}).get("time_s")
+        delta = f"{(m['time_s'] / base - 1) * 100:+.0f}%" if base else "—"
+        peak = f"{m['peak_mb']:.1f}" if m["peak_mb"] is not None else "—"
+        print(f"{name:<34} {m['time_s']:>10.4f} {peak:>10} {m['out_kb']:>11.1f} {delta:>9}", flush=True)
+
+    if args.save_baseline:
+        merged = {**baseline, **results}
+        args.baseline.write_text(json.dumps({
+            "python": platform.python_version(), "machine": platform.platform(), "results": merged,
+        }, indent=2, sort_keys=True), encoding="utf-8")
+        print(f"Linha de base gravada em {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline)
+    for line in regressions:
+        print(f"REGRESSÃO {line}")
+    if baseline and not regressions:
+        print("Sem regressões em relação à linha de base.")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+Uploads para Google Drive e GitHub (sem dependência de Streamlit)
+"""
+
+import io, os, json, mmap, time, base64, hashlib, random, tempfile, threading, datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class UploadError(RuntimeError):
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+# ===================== Google Drive (inclui Shared Drives) =====================
+DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive.file"]
+CHUNK_MULTIPLE = 256 * 1024
+
+class DriveClient:
+    """Cliente Drive reaproveitado pelo processo inteiro (thread-safe).
+
+    O serviço (documento de discovery) é montado uma vez; o token de acesso fica
+    em cache e é renovado antes de expirar; cada thread reaproveita o próprio
+    transporte httplib2 (keep-alive), já que httplib2 não é thread-safe.
+    """
+
+    def __init__(self, sa_info: dict, api_endpoint: Optional[str] = None, refresh_margin: float = 300.0, timeout: float = 60.0,
+                 chunk_size: int = 8 * 1024 * 1024, resumable_threshold: int = 5 * 1024 * 1024, chunk_retries: int = 5):
+        import httplib2, requests
+        import google.auth.transport.requests
+        from google.oauth2.service_account import Credentials
+        from googleapiclient.discovery import build
+        self._creds = Credentials.from_service_account_info(sa_info, scopes=DRIVE_SCOPES)
+        # Sessão própria (keep-alive) para o endpoint de token
+        self._token_request = google.auth.transport.requests.Request(session=requests.Session())
+        self._refresh_margin = refresh_margin
+        self._timeout = timeout
+        # O Drive exige pedaços múltiplos de 256 KiB
+        self.chunk_size = max(CHUNK_MULTIPLE, chunk_size // CHUNK_MULTIPLE * CHUNK_MULTIPLE)
+        self.resumable_threshold = resumable_threshold
+        self.chunk_retries = chunk_retries
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        client_options = {"api_endpoint": api_endpoint} if api_endpoint else None
+        # Transporte "neutro" só para montar o serviço; cada execute() usa o da thread
+        self.service = build("drive", "v3", http=httplib2.Http(timeout=timeout), static_discovery=True,
+                             cache_discovery=False, client_options=client_options)
+
+    def _ensure_token(self) -> None:
+        """Renova o token `refresh_margin` segundos antes de expirar (uma thread por vez)."""
+        with self._lock:
+            expiry = self._creds.expiry  # UTC sem tzinfo
+            now = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+            if self._creds.token and expiry and (expiry - now).total_seconds() > self._refresh_margin:
+                return
+            self._creds.refresh(self._token_request)
+
+    def http(self):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            import httplib2
+            from google_auth_httplib2 import AuthorizedHttp
+            base = httplib2.Http(timeout=self._timeout)
+            # Como em googleapiclient.http.build_http: 308 é "Resume Incomplete", não redirect
+            base.redirect_codes = base.redirect_codes - {308}
+            http = self._local.http = AuthorizedHttp(self._creds, http=base)
+        return http
+
+    def execute(self, request):
+        self._ensure_token()
+        return request.execute(http=self.http())
+
+    def get_metadata(self, file_id: str, fields: str = "id,name,mimeType") -> dict:
+        return self.execute(self.service.files().get(fileId=file_id, fields=fields, supportsAllDrives=True))
+
+    def upload(self, folder_id: str, filename: str, data: bytes, mime: str, file_id: Optional[str] = None) -> dict:
+        """Cria o arquivo, ou substitui o conteúdo de `file_id` se ele ainda existir.
+
+        Acima de `resumable_threshold` bytes o envio é resumable, em pedaços de
+        `chunk_size`, lidos de um arquivo temporário.
+        """
+        from googleapiclient.errors import HttpError
+        if file_id:
+            try:
+                return self._send(lambda media: self.service.files().update(
+                    fileId=file_id,
+                    media_body=media,
+                    fields="id, webViewLink",
+                    supportsAllDrives=True,
+                ), data, mime)
+            except HttpError as e:
+                if getattr(e.resp, "status", None) != 404:
+                    raise
+                # Apagado no Drive: cai para a criação de um arquivo novo
+        file_metadata = {"name": filename, "parents": [folder_id]}
+        return self._send(lambda media: self.service.files().create(
+            body=file_metadata,
+            media_body=media,
+            fields="id, webViewLink",
+            supportsAllDrives=True,  # <— ESSENCIAL p/ Shared Drives
+        ), data, mime)
+
+    def _send(self, make_request: Callable[[object], object], data: bytes, mime: str) -> dict:
+        from googleapiclient.http import MediaIoBaseUpload
+        if isinstance(data, mmap.mmap):
+            # Já está em disco (anexo): o próprio mmap é a fonte dos pedaços, sem cópia
+            data.seek(0)
+            if len(data) <= self.resumable_threshold:
+                return self.execute(make_request(MediaIoBaseUpload(data, mimetype=mime, resumable=False)))
+            return self._upload_chunks(make_request(MediaIoBaseUpload(data, mimetype=mime, chunksize=self.chunk_size, resumable=True)))
+        if len(data) <= self.resumable_threshold:
+            return self.execute(make_request(MediaIoBaseUpload(io.BytesIO(data), mimetype=mime, resumable=False)))
+        # Spool em disco: o corpo de cada requisição tem no máximo `chunk_size` bytes
+        with tempfile.SpooledTemporaryFile(max_size=self.chunk_size) as spool:
+            spool.write(data)
+            spool.seek(0)
+            media = MediaIoBaseUpload(spool, mimetype=mime, chunksize=self.chunk_size, resumable=True)
+            return self._upload_chunks(make_request(media))
+
+    def _upload_chunks(self, request) -> dict:
+        """Envia pedaço a pedaço; após uma falha, retoma do último offset confirmado."""
+        response, failures = None, 0
+        while response is None:
+            self._ensure_token()
+            try:
+                _, response = request.next_chunk(http=self.http())
+                failures = 0
+            except Exception as e:
+                failures += 1
+                if not _is_retryable(e, frozenset(RETRYABLE_STATUS)) or failures > self.chunk_retries or not getattr(request, "resumable_uri", None):
+                    raise
+                # A próxima next_chunk() consulta o servidor ("bytes */total") e continua dali
+                time.sleep(min(30.0, 2 ** (failures - 1)) * random.uniform(0.5, 1.5))
+        return response
+
+# ===================== GitHub =====================
+class GitHubClient:
+    """Cliente da API do GitHub sobre um `requests.Session` com pool de conexões (keep-alive)."""
+
+    def __init__(self, token: str, repo: str, branch: str = "main", base_path: str = "reports",
+                 api_url: str = "https://api.github.com", pool_size: int = 8, timeout: float = 30.0):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.repo, self.branch, self.base_path = repo, branch, base_path.strip("/")
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        # Sem retry no adapter: quem decide tentar de novo é run_uploads()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Authorization": f"token {token}", "Accept": "application/vnd.github+json"})
+
+    def request(self, method: str, path: str, **kwargs):
+        r = self.session.request(method, f"{self.api_url}/repos/{self.repo}/{path.lstrip('/')}", timeout=self.timeout, **kwargs)
+        if r.status_code >= 400:
+            raise UploadError(f"GitHub API: {r.status_code} – {r.text}", status=r.status_code)
+        return r.json() if r.content else {}
+
+    def publish(self, files: List[Tuple[str, bytes]], message: str, attempts: int = 3) -> Dict[str, object]:
+        """Publica vários arquivos num único commit (Git Data API: blobs, tree, commit, ref).
+
+        Caminhos existentes são atualizados no lugar; arquivos cujo SHA git já bate
+        com o do repositório são pulados. Se nada mudou, nenhum commit é criado.
+        Se a branch andar no meio do caminho (ref não fast-forward), tenta de novo.
+        """
+        for attempt in range(attempts):
+            head = self.request("GET", f"commits/{self.branch}")
+            head_sha, base_tree = head["sha"], head["commit"]["tree"]["sha"]
+            existing = self._blob_shas(base_tree)
+            entries, skipped = [], []
+            for filename, data in files:
+                path = f"{self.base_path}/{filename}" if self.base_path else filename
+                if existing.get(path) == git_blob_sha(data):
+                    skipped.append(filename)
+                    continue
+                entry = {"path": path, "mode": "100644", "type": "blob"}
+                text = None
+                if isinstance(data, bytes):  # anexos (mmap) vão sempre como blob
+                    try:
+                        text = data.decode("utf-8")
+                    except UnicodeDecodeError:
+                        pass
+                if text is not None:
+                    entry["content"] = text  # texto vai inline na tree
+                else:
+                    blob = self.request("POST", "git/blobs", json={"content": base64.b64encode(data).decode("ascii"), "encoding": "base64"})
+                    entry["sha"] = blob["sha"]
+                entries.append(entry)
+            if not entries:
+                return {"commit": head_sha, "url": head.get("html_url", ""), "updated": [], "skipped": skipped}
+            tree = self.request("POST", "git/trees", json={"base_tree": base_tree, "tree": entries})
+            commit = self.request("POST", "git/commits", json={"message": message, "tree": tree["sha"], "parents": [head_sha]})
+            try:
+                self.request("PATCH", f"git/refs/heads/{self.branch}", json={"sha": commit["sha"], "force": False})
+            except UploadError as e:
+                if e.status == 422 and attempt < attempts - 1:
+                    continue  # outro commit entrou na branch; refaz sobre o novo HEAD
+                raise
+            updated = [e["path"].rsplit("/", 1)[-1] for e in entries]
+            return {"commit": commit["sha"], "url": commit.get("html_url", ""), "updated": updated, "skipped": skipped}
+        raise UploadError("GitHub: branch mudou durante a publicação")
+
+    def _blob_shas(self, base_tree: str) -> Dict[str, str]:
+        """SHA git de cada arquivo em `base_path` (vazio se a pasta ainda não existe).
+
+        Lê só a subárvore da pasta (``git/trees/<tree>:<pasta>``): a API de conteúdo
+        lista no máximo 1.000 itens, e a pasta cresce a cada relatório.
+        """
+        ref = f"{base_tree}:{self.base_path}" if self.base_path else base_tree
+        try:
+            tree = self.request("GET", f"git/trees/{quote(ref, safe='/:')}")
+        except UploadError as e:
+            if e.status == 404:
+                return {}
+            raise
+        prefix = f"{self.base_path}/" if self.base_path else ""
+        return {prefix + item["path"]: item["sha"] for item in tree.get("tree", []) if item.get("type") == "blob"}
+
+def git_blob_sha(data: bytes) -> str:
+    """SHA-1 que o git atribui a um blob com esse conteúdo."""
+    h = hashlib.sha1(b"blob %d\0" % len(data))
+    h.update(data)  # aceita mmap sem copiar
+    return h.hexdigest()
+
+# ===================== Clientes compartilhados =====================
+_clients: Dict[str, object] = {}
+_clients_lock = threading.Lock()
+
+def _shared(kind: str, cfg: dict, factory: Callable[[], object]):
+    key = kind + ":" + json.dumps(cfg, sort_keys=True, default=str)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = factory()
+        return client
+
+def get_drive_client(sa_info: dict, api_endpoint: Optional[str] = None, **options) -> DriveClient:
+    """Um DriveClient por conta de serviço (e opções), reaproveitado pelo processo inteiro."""
+    return _shared("drive", {"sa": sa_info, "api_endpoint": api_endpoint, **options},
+                   lambda: DriveClient(sa_info, api_endpoint=api_endpoint, **options))
+
+def get_github_client(gh: dict) -> GitHubClient:
+    """Um GitHubClient por configuração [github], reaproveitado pelo processo inteiro."""
+    if not gh.get("token") or not gh.get("repo"):
+        raise UploadError("Token/Repo não configurados em st.secrets['github']")
+    return _shared("github", gh, lambda: GitHubClient(
+        gh["token"], gh["repo"], gh.get("branch", "main"), gh.get("base_path", "reports"),
+        api_url=gh.get("api_url", "https://api.github.com"),
+    ))
+
+# ===================== Manifesto de uploads =====================
+class UploadManifest:
+    """Registro local, por destino, do hash e do id remoto de cada artefato já enviado.
+
+    Formato: ``{destino: {arquivo: {"sha256", "id", "url"}}}``, gravado de forma
+    atômica (arquivo temporário + ``os.replace``).
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        try:
+            self._data: Dict[str, Dict[str, dict]] = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self._data = {}
+
+    def lookup(self, destination: str, name: str) -> Optional[dict]:
+        with self._lock:
+            return self._data.get(destination, {}).get(name)
+
+    def unchanged(self, destination: str, name: str, data: bytes = b"", sha256: Optional[str] = None) -> Optional[dict]:
+        """A entrada do manifesto, se o conteúdo enviado da última vez for idêntico.
+
+        `sha256` dispensa o hash de `data` quando ele já é conhecido (anexos)."""
+        entry = self.lookup(destination, name)
+        if entry and entry.get("sha256") == (sha256 or hashlib.sha256(data).hexdigest()):
+            return entry
+        return None
+
+    def record(self, destination: str, name: str, data: bytes = b"", remote_id: str = "", url: str = "",
+               sha256: Optional[str] = None) -> None:
+        entry = {"sha256": sha256 or hashlib.sha256(data).hexdigest(), "id": remote_id, "url": url}
+        with self._lock:
+            self._data.setdefault(destination, {})[name] = entry
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps(self._data, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+_manifests: Dict[str, UploadManifest] = {}
+
+def get_manifest(path: Path) -> UploadManifest:
+    """Um UploadManifest por arquivo, compartilhado pelo processo."""
+    key = str(Path(path).resolve())
+    with _clients_lock:
+        if key not in _manifests:
+            _manifests[key] = UploadManifest(Path(path))
+        return _manifests[key]
+
+# ===================== Estágio de upload concorrente =====================
+@dataclass
+class UploadTask:
+    destination: str  # "drive" | "github"
+    name: str
+    data: bytes
+    mime: str
+    upload: Callable[[], str]  # envia e devolve a URL
+    retry_status: frozenset = frozenset(RETRYABLE_STATUS)
+    size: Optional[int] = None  # padrão: len(data)
+
+@dataclass
+class UploadResult:
+    destination: str
+    name: str
+    url: str = ""
+    size: int = 0
+    elapsed: float = 0.0
+    attempts: int = 0
+    error: str = ""
+    skipped: bool = False  # conteúdo idêntico ao último envio
+
+    @property
+    def ok(self) -> bool:
+        return not self.error
+
+def _status_of(exc: Exception) -> Optional[int]:
+    status = getattr(exc, "status", None)
+    if status is None and getattr(exc, "resp", None) is not None:  # googleapiclient HttpError
+        status = getattr(exc.resp, "status", None)
+    if status is None and getattr(exc, "response", None) is not None:  # requests.HTTPError
+        status = getattr(exc.response, "status_code", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def _is_retryable(exc: Exception, retry_status: frozenset) -> bool:
+    status = _status_of(exc)
+    if status is not None:
+        return status in retry_status
+    # Sem status HTTP: falha de rede/timeout vale nova tentativa; erro de configuração não
+    if isinstance(exc, (OSError, TimeoutError)) or type(exc).__name__ == "TransportError":  # google.auth
+        return True
+    return type(exc).__module__.startswith(("requests", "urllib3", "httplib2"))
+
+def _run_task(task: UploadTask, retries: int, backoff: float, sleep: Callable[[float], None]) -> UploadResult:
+    res = UploadResult(task.destination, task.name, size=len(task.data) if task.size is None else task.size)
+    t0 = time.perf_counter()
+    for attempt in range(retries + 1):
+        res.attempts = attempt + 1
+        try:
+            res.url = task.upload() or ""
+            res.error = ""
+            break
+        except Exception as e:
+            res.error = f"{type(e).__name__}: {e}"
+            if attempt == retries or not _is_retryable(e, task.retry_status):
+                break
+            # Backoff exponencial com jitter: 1s, 2s, 4s, ... (±50%)
+            sleep(backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+    res.elapsed = time.perf_counter() - t0
+    return res
+
+def run_uploads(tasks: List[UploadTask], max_workers: int = 4, retries: int = 3, backoff: float = 1.0,
+                sleep: Callable[[float], None] = time.sleep) -> List[UploadResult]:
+    """Envia todos os artefatos para todos os destinos em paralelo (concorrência limitada).
+
+    Cada arquivo é tentado de novo, com backoff exponencial, em 429/5xx e falhas de
+    rede. Os resultados voltam na ordem das tarefas.
+    """
+    if not tasks:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks))), thread_name_prefix="upload") as ex:
+        return list(ex.map(lambda t: _run_task(t, retries, backoff, sleep), tasks))
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Código automático de relatórios: alocação atômica e segura entre sessões/processos
+"""
+
+import os, sys, json, threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+COUNTER_FILE_DEFAULT = "counter.json"
+LOCK_FILE_DEFAULT = "counter.lock"
+
+_thread_lock = threading.Lock()
+
+@contextmanager
+def _file_lock(path: Path):
+    """Lock exclusivo entre processos (flock no POSIX, msvcrt no Windows)."""
+    with _thread_lock, open(path, "a+b") as fh:
+        if os.name == "nt":
+            import msvcrt
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+def _read_counters(cfile: Path) -> Dict[str, int]:
+    if not cfile.exists():
+        return {}
+    # Arquivo ilegível é erro: voltar a 0 geraria códigos duplicados
+    data = json.loads(cfile.read_text(encoding="utf-8"))
+    counters = {k: int(v) for k, v in data.get("counters", {}).items()}
+    if "counter" in data:  # formato antigo: um contador único para todos os prefixos
+        counters.setdefault("*", int(data["counter"]))
+    return counters
+
+def _write_durable(cfile: Path, counters: Dict[str, int]) -> None:
+    tmp = cfile.with_name(f"{cfile.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump({"counters": counters}, fh, ensure_ascii=False, indent=2)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, cfile)
+    if os.name != "nt":  # garante que o rename em si chegou ao disco
+        dfd = os.open(cfile.parent, os.O_RDONLY)
+        try:
+            os.fsync(dfd)
+        finally:
+            os.close(dfd)
+
+def allocate_codes(prefix: str = "MavipeRTEC", count: int = 1, draft_dir: Optional[str] = None) -> List[str]:
+    """Reserva `count` códigos consecutivos para `prefix` (um contador por prefixo).
+
+    O contador é lido, incrementado e gravado sob um lock de arquivo, com escrita
+    atômica (temporário + fsync + rename), então sessões e processos concorrentes
+    nunca recebem o mesmo código e uma queda no meio não zera o contador.
+    """
+    if count < 1:
+        raise ValueError("count deve ser >= 1")
+    pdir = Path(draft_dir) if draft_dir else Path.cwd() / "drafts"
+    pdir.mkdir(parents=True, exist_ok=True)
+    cfile = pdir / COUNTER_FILE_DEFAULT
+    with _file_lock(pdir / LOCK_FILE_DEFAULT):
+        counters = _read_counters(cfile)
+        start = counters.get(prefix, counters.get("*", 0))
+        counters[prefix] = start + count
+        _write_durable(cfile, counters)
+    return [f"{prefix}{n:03d}" for n in range(start + 1, start + count + 1)]
+
+def next_report_code(prefix: str = "MavipeRTEC", draft_dir: Optional[str] = None) -> str:
+    return allocate_codes(prefix, 1, draft_dir)[0]
+
+# ===================== Teste de estresse =====================
+def _stress_worker(args) -> List[str]:
+    draft_dir, prefix, rounds, block = args
+    out: List[str] = []
+    for i in range(rounds):
+        out += allocate_codes(prefix, block if i % 2 else 1, draft_dir)
+    return out
+
+def stress(processes: int = 16, rounds: int = 200, block: int = 5, draft_dir: Optional[str] = None) -> int:
+    """Martela o alocador a partir de vários processos e confere que não há duplicatas."""
+    import tempfile, time
+    from concurrent.futures import ProcessPoolExecutor
+    draft_dir = draft_dir or tempfile.mkdtemp(prefix="codes-stress-")
+    prefixes = ["A", "B"]
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes) as ex:
+        results = list(ex.map(_stress_worker, [(draft_dir, prefixes[i % 2], rounds, block) for i in range(processes)]))
+    elapsed = time.perf_counter() - t0
+    codes = [c for r in results for c in r]
+    dupes = len(codes) - len(set(codes))
+    counters = _read_counters(Path(draft_dir) / COUNTER_FILE_DEFAULT)
+    expected = {p: sum(len(r) for i, r in enumerate(results) if prefixes[i % 2] == p) for p in prefixes}
+    ok = dupes == 0 and all(counters.get(p) == n for p, n in expected.items())
+    calls = processes * rounds
+    print(f"{calls} alocações ({len(codes)} códigos) em {elapsed:.2f}s – {calls / elapsed:.0f}/s; "
+          f"duplicatas: {dupes}; contadores: {counters} (esperado {expected}) -> {'OK' if ok else 'FALHOU'}")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    # python codes.py [processos] [rodadas]
+    sys.exit(stress(*(int(a) for a in sys.argv[1:3])))
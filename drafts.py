@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Rascunhos indexados (SQLite): autosave incremental e histórico de versões com diffs
+"""
+
+import json, sqlite3, threading, datetime as dt
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Colunas indexadas para busca (o restante do relatório fica em draft_fields)
+INDEXED = ("titulo", "cliente", "projeto", "codigo", "data", "versao")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS drafts (
+    id TEXT PRIMARY KEY,
+    titulo TEXT, cliente TEXT, projeto TEXT, codigo TEXT, data TEXT, versao TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    head_rev INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS drafts_cliente ON drafts(cliente COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS drafts_projeto ON drafts(projeto COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS drafts_codigo ON drafts(codigo COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS drafts_data ON drafts(data);
+CREATE INDEX IF NOT EXISTS drafts_versao ON drafts(versao);
+CREATE INDEX IF NOT EXISTS drafts_updated ON drafts(updated_at);
+CREATE TABLE IF NOT EXISTS draft_fields (
+    draft_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (draft_id, field)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS revisions (
+    draft_id TEXT NOT NULL,
+    rev INTEGER NOT NULL,
+    saved_at TEXT NOT NULL,
+    patch TEXT NOT NULL,
+    PRIMARY KEY (draft_id, rev)
+) WITHOUT ROWID;
+"""
+
+class DraftStore:
+    """Rascunhos em SQLite (WAL), um registro por relatório.
+
+    Cada autosave grava só os campos que mudaram e acrescenta uma revisão com o
+    patch correspondente: textos guardam um diff por linhas em relação à versão
+    anterior; os demais campos guardam o novo valor. Qualquer versão antiga é
+    reconstruída aplicando os patches em ordem.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # Uma conexão por thread (os jobs em segundo plano também gravam aqui)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ---------- gravação ----------
+    def save(self, draft_id: str, doc: Dict[str, Any]) -> Optional[int]:
+        """Grava os campos alterados de `doc`. Devolve a nova revisão, ou None se nada mudou."""
+        with self._write_lock, self._conn() as conn:
+            current = self._fields(conn, draft_id)
+            changed = {k: v for k, v in doc.items() if k not in current or current[k] != v}
+            if not changed:
+                return None
+            now = _now()
+            row = conn.execute("SELECT head_rev FROM drafts WHERE id = ?", (draft_id,)).fetchone()
+            rev = (row[0] if row else 0) + 1
+            index = {k: str(doc.get(k, "")) for k in INDEXED}
+            if row:
+                conn.execute(
+                    f"UPDATE drafts SET {', '.join(f'{k} = ?' for k in INDEXED)}, updated_at = ?, head_rev = ? WHERE id = ?",
+                    (*index.values(), now, rev, draft_id),
+                )
+            else:
+                conn.execute(
+                    f"INSERT INTO drafts (id, {', '.join(INDEXED)}, created_at, updated_at, head_rev) VALUES (?, {', '.join('?' * len(INDEXED))}, ?, ?, ?)",
+                    (draft_id, *index.values(), now, now, rev),
+                )
+            conn.executemany(
+                "INSERT OR REPLACE INTO draft_fields (draft_id, field, value) VALUES (?, ?, ?)",
+                [(draft_id, k, json.dumps(v, ensure_ascii=False)) for k, v in changed.items()],
+            )
+            patch = {k: _make_patch(current.get(k), v) for k, v in changed.items()}
+            conn.execute("INSERT INTO revisions (draft_id, rev, saved_at, patch) VALUES (?, ?, ?, ?)",
+                         (draft_id, rev, now, json.dumps(patch, ensure_ascii=False, separators=(",", ":"))))
+            return rev
+
+    # ---------- leitura ----------
+    def load(self, draft_id: str, rev: Optional[int] = None) -> Dict[str, Any]:
+        """O rascunho atual, ou como estava na revisão `rev`."""
+        conn = self._conn()
+        if rev is None:
+            doc = self._fields(conn, draft_id)
+            if not doc:
+                raise KeyError(draft_id)
+            return doc
+        doc: Dict[str, Any] = {}
+        rows = conn.execute("SELECT patch FROM revisions WHERE draft_id = ? AND rev <= ? ORDER BY rev", (draft_id, rev))
+        for (patch,) in rows:
+            for field, p in json.loads(patch).items():
+                doc[field] = _apply_patch(doc.get(field), p)
+        if not doc:
+            raise KeyError(f"{draft_id}@{rev}")
+        return doc
+
+    def search(self, text: str = "", limit: int = 50, **filters: str) -> List[Dict[str, Any]]:
+        """Busca por texto (título, cliente, projeto, código) e/ou filtros exatos por coluna indexada."""
+        where, args = [], []
+        if text.strip():
+            like = f"%{text.strip()}%"
+            where.append("(" + " OR ".join(f"{k} LIKE ? COLLATE NOCASE" for k in ("titulo", "cliente", "projeto", "codigo")) + ")")
+            args += [like] * 4
+        for k, v in filters.items():
+            if k not in INDEXED:
+                raise ValueError(f"Filtro desconhecido: {k}")
+            if v:
+                where.append(f"{k} = ? COLLATE NOCASE")
+                args.append(v)
+        sql = f"SELECT id, {', '.join(INDEXED)}, updated_at, head_rev FROM drafts"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY updated_at DESC LIMIT ?"
+        cols = ("id", *INDEXED, "updated_at", "head_rev")
+        return [dict(zip(cols, row)) for row in self._conn().execute(sql, (*args, limit))]
+
+    def history(self, draft_id: str) -> List[Dict[str, Any]]:
+        rows = self._conn().execute("SELECT rev, saved_at, patch FROM revisions WHERE draft_id = ? ORDER BY rev DESC", (draft_id,))
+        return [{"rev": rev, "saved_at": saved_at, "fields": sorted(json.loads(patch))} for rev, saved_at, patch in rows]
+
+    def iter_drafts(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """(id, rascunho atual) de todos os rascunhos, do mais antigo ao mais recente."""
+        conn = self._conn()
+        ids = [row[0] for row in conn.execute("SELECT id FROM drafts ORDER BY updated_at")]
+        for draft_id in ids:
+            yield draft_id, self._fields(conn, draft_id)
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM drafts").fetchone()[0]
+
+    def import_json_dir(self, folder: Path) -> int:
+        """Importa rascunhos antigos (*.json soltos na pasta), usando o nome do arquivo como id."""
+        n = 0
+        for f in sorted(Path(folder).glob("*.json")):
+            try:
+                doc = json.loads(f.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            if isinstance(doc, dict) and "titulo" in doc and self.save(f"json:{f.stem}", doc):
+                n += 1
+        return n
+
+    @staticmethod
+    def _fields(conn: sqlite3.Connection, draft_id: str) -> Dict[str, Any]:
+        rows = conn.execute("SELECT field, value FROM draft_fields WHERE draft_id = ?", (draft_id,))
+        return {field: json.loads(value) for field, value in rows}
+
+# ===================== Patches =====================
+def _make_patch(old: Any, new: Any) -> Dict[str, Any]:
+    """Diff por linhas para textos; valor completo para o resto (listas, números...)."""
+    if not isinstance(old, str) or not isinstance(new, str):
+        return {"v": new}
+    a, b = old.splitlines(keepends=True), new.splitlines(keepends=True)
+    ops: List[list] = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append(["=", i2 - i1])
+        else:
+            if i2 > i1:
+                ops.append(["-", i2 - i1])
+            if j2 > j1:
+                ops.append(["+", "".join(b[j1:j2])])
+    # Se o diff não compensar (texto todo novo), guarda o valor
+    if len(json.dumps(ops, ensure_ascii=False)) >= len(json.dumps(new, ensure_ascii=False)):
+        return {"v": new}
+    return {"d": ops}
+
+def _apply_patch(old: Any, patch: Dict[str, Any]) -> Any:
+    if "v" in patch:
+        return patch["v"]
+    a = (old or "").splitlines(keepends=True)
+    out, i = [], 0
+    for op, arg in patch["d"]:
+        if op == "=":
+            out.extend(a[i:i + arg]); i += arg
+        elif op == "-":
+            i += arg
+        else:
+            out.append(arg)
+    return "".join(out)
+
+_stores: Dict[str, DraftStore] = {}
+_stores_lock = threading.Lock()
+
+def get_draft_store(draft_dir: Optional[str] = None) -> DraftStore:
+    """Um DraftStore por pasta (`<pasta>/drafts.db`), compartilhado pelo processo."""
+    path = (Path(draft_dir) if draft_dir else Path.cwd() / "drafts") / "drafts.db"
+    key = str(path.resolve())
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = DraftStore(path)
+        return _stores[key]
+
+def _now() -> str:
+    return dt.datetime.now().isoformat(timespec="milliseconds")
@@ -0,0 +1,639 @@
+# -*- coding: utf-8 -*-
+"""
+Exportadores (MD/PDF/DOCX), preparo de imagens (logo e anexos), cache de renderização e pipeline paralelo
+"""
+
+import io, os, re, sys, json, mmap, time, weakref, hashlib, threading
+import multiprocessing as mp
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Collection, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from xml.sax.saxutils import escape
+
+from models import Anexo, Relatorio
+
+# ===================== Helpers =====================
+def to_markdown(r: Relatorio) -> str:
+    autores_md = "\n".join([f"- {a.nome} ({a.cargo}) <{a.email}>" for a in r.autores if a.nome.strip()])
+    refs_md = "\n".join([f"- {x.referencia}" for x in r.referencias if x.referencia.strip()])
+    anexos_md = "\n".join([
+        f"- **{a.titulo}** – {a.descricao} {(f'({a.link})' if a.link else '')}{(f' 📎 {attachment_label(a)}' if a.arquivo else '')}"
+        for a in r.anexos if a.titulo.strip()
+    ])
+    parts = [
+        f"# {r.titulo}",
+        f"**Cliente:** {r.cliente}  ",
+        f"**Projeto:** {r.projeto}  ",
+        f"**Código:** {r.codigo}  ",
+        f"**Data:** {r.data}  ",
+        f"**Versão:** {r.versao}",
+        "\n---\n",
+        "## Autores",
+        autores_md or "(preencher)",
+        f"\n**Aprovador:** {r.aprovador or '(preencher)'}\n",
+        "\n## Resumo Executivo\n" + (r.resumo_exec or "(preencher)"),
+        "\n## Escopo\n" + (r.escopo or "(preencher)"),
+        "\n## Dados & Fontes\n" + (r.dados_fontes or "(preencher)"),
+        "\n## Metodologia\n" + (r.metodologia or "(preencher)"),
+        "\n## Resultados\n" + (r.resultados or "(preencher)"),
+        "\n## Discussões\n" + (r.discussoes or "(preencher)"),
+        "\n## Conclusões\n" + (r.conclusoes or "(preencher)"),
+        "\n## Recomendações\n" + (r.recomendacoes or "(preencher)"),
+        "\n## Referências\n" + (refs_md or "(preencher)"),
+        "\n## Anexos\n" + (anexos_md or "(preencher)"),
+        "\n## Observações\n" + (r.observacoes or ""),
+    ]
+    return "\n".join(parts)
+
+def get_logo_dims_cm(logo_bytes: bytes, width_cm: float) -> Tuple[float, float]:
+    logo = prepare_logo(logo_bytes, width_cm)
+    return logo.width_cm, logo.height_cm
+
+# ===================== Imagens (logo e anexos) =====================
+LOGO_DPI = 300  # resolução de impressão; acima disso o logo só engorda o arquivo
+ATTACHMENT_DPI = 200
+ATTACHMENT_MAX_CM = (16.0, 22.0)  # caixa máxima (largura, altura) de uma imagem anexada, dentro das margens A4
+IMAGE_CACHE_ENTRIES = 32
+# Orçamento do cache de imagens preparadas, por processo (cada worker do pool tem o seu):
+# anexos que não precisam ser reduzidos guardam os bytes originais
+IMAGE_CACHE_BYTES = 16 * 1024 * 1024
+
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+@dataclass(frozen=True)
+class PreparedImage:
+    data: bytes        # imagem pronta para embutir (reduzida e recomprimida)
+    width_cm: float
+    height_cm: float
+    original_size: int
+
+# Logo bruto (bytes enviados) ou já preparado por `prepare_logo` (ex.: no processo pai)
+Logo = Union[bytes, PreparedImage]
+
+_image_cache: "OrderedDict[Tuple[str, float, int], PreparedImage]" = OrderedDict()
+_image_cache_size = 0  # soma de len(data) das entradas
+_image_lock = threading.Lock()
+
+def clear_image_cache() -> None:
+    """Esvazia o cache de imagens preparadas (benchmarks medem a execução fria)."""
+    global _image_cache_size
+    with _image_lock:
+        _image_cache.clear()
+        _image_cache_size = 0
+
+def prepare_image(data: Buffer, width_cm: float, dpi: int = LOGO_DPI, digest: Optional[str] = None) -> PreparedImage:
+    """Decodifica a imagem uma vez por conteúdo (sha256) e largura: reduz para `dpi`
+    na largura impressa, recomprime e guarda dimensões + bytes otimizados.
+
+    PDF e DOCX usam o mesmo resultado. Se a recompressão de um PNG/JPEG não ganhar
+    nada, os bytes originais são mantidos; outros formatos (WEBP, GIF...) são sempre
+    reescritos, porque o python-docx e o reportlab não leem todos. `data` pode ser um mmap (anexos); `digest`
+    evita recalcular o hash quando ele já é conhecido.
+    """
+    key = (digest or hashlib.sha256(data).hexdigest(), round(float(width_cm), 3), dpi)
+    with _image_lock:
+        cached = _image_cache.get(key)
+        if cached is not None:
+            _image_cache.move_to_end(key)
+            return cached
+
+    from PIL import Image as PILImage
+    img = PILImage.open(io.BytesIO(data) if isinstance(data, bytes) else data)
+    w, h = img.size
+    if not w or not h:
+        prepared = PreparedImage(bytes(data), width_cm, width_cm * 0.5, len(data))
+    else:
+        target_w = max(1, round(width_cm / 2.54 * dpi))
+        out = None
+        if w > target_w or img.format not in ("PNG", "JPEG"):
+            out = _recompress(img, target_w)
+        if out is None or (len(out) >= len(data) and img.format in ("PNG", "JPEG")):
+            out = bytes(data)
+        prepared = PreparedImage(out, width_cm, width_cm * h / w, len(data))
+
+    _cache_image(key, prepared)
+    return prepared
+
+def _cache_image(key: Tuple[str, float, int], prepared: PreparedImage) -> None:
+    """LRU limitado por `IMAGE_CACHE_ENTRIES` e `IMAGE_CACHE_BYTES`."""
+    global _image_cache_size
+    if len(prepared.data) > IMAGE_CACHE_BYTES // 4:
+        return  # imagem grande: guardá-la expulsaria todo o resto
+    with _image_lock:
+        old = _image_cache.pop(key, None)
+        if old is not None:
+            _image_cache_size -= len(old.data)
+        _image_cache[key] = prepared
+        _image_cache_size += len(prepared.data)
+        while len(_image_cache) > IMAGE_CACHE_ENTRIES or _image_cache_size > IMAGE_CACHE_BYTES:
+            _, evicted = _image_cache.popitem(last=False)
+            _image_cache_size -= len(evicted.data)
+
+def prepare_logo(logo: Logo, width_cm: float, dpi: int = LOGO_DPI) -> PreparedImage:
+    """O logo pronto para embutir; um `PreparedImage` (já preparado) passa direto."""
+    if isinstance(logo, PreparedImage):
+        return logo
+    return prepare_image(logo, width_cm, dpi)
+
+def attachment_images(r: Relatorio) -> Iterator[Tuple[Anexo, PreparedImage]]:
+    """Anexos que são imagens, lidos do store por mmap e reduzidos para caber na página.
+
+    Anexos ausentes do store ou que não decodificam são ignorados (continuam listados).
+    """
+    if not any(a.sha256 and a.mime.startswith("image/") for a in r.anexos):
+        return
+    from attachments import get_attachment_store
+    store = get_attachment_store()
+    max_w, max_h = ATTACHMENT_MAX_CM
+    for a in r.anexos:
+        if not a.sha256 or not a.mime.startswith("image/") or not store.exists(a.sha256):
+            continue
+        try:
+            with store.open(a.sha256) as mm:
+                img = prepare_image(mm, max_w, ATTACHMENT_DPI, digest=a.sha256)
+        except Exception:
+            continue
+        if img.height_cm > max_h:  # imagem alta: limita pela altura
+            img = PreparedImage(img.data, img.width_cm * max_h / img.height_cm, max_h, img.original_size)
+        yield a, img
+
+def attachment_label(a: Anexo) -> str:
+    """``arquivo.ext, 1.2 MB`` para listar o anexo nos documentos."""
+    size = a.tamanho
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            human = f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+            break
+        size /= 1024
+    return f"{a.arquivo}, {human}"
+
+def _recompress(img, target_w: int) -> bytes:
+    """Reduz para `target_w` px de largura; PNG se houver transparência, senão o menor entre PNG e JPEG."""
+    from PIL import Image as PILImage
+    img.load()
+    if img.width > target_w:
+        img = img.resize((target_w, max(1, round(img.height * target_w / img.width))), PILImage.LANCZOS)
+    alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+    if img.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+        img = img.convert("RGBA" if alpha else "RGB")
+    candidates = []
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", optimize=True)
+    candidates.append(buf.getvalue())
+    if not alpha:
+        buf = io.BytesIO()
+        img.convert("L" if img.mode == "L" else "RGB").save(buf, format="JPEG", quality=88, optimize=True)
+        candidates.append(buf.getvalue())
+    return min(candidates, key=len)
+
+# ===================== Exportadores =====================
+PDF_MAX_PARAGRAPH = 3000  # caracteres por flowable: parágrafos maiores são quebrados por linha/palavra
+
+def _pdf_chunks(text: str, limit: int = PDF_MAX_PARAGRAPH) -> Iterator[List[str]]:
+    """Parágrafos (separados por linha em branco) como listas de linhas, com no máximo
+    ~`limit` caracteres cada; linhas enormes são cortadas em espaços."""
+    for para in re.split(r"\n\s*\n", text.strip()):
+        lines: List[str] = []
+        size = 0
+        for line in para.split("\n"):
+            while len(line) > limit:
+                cut = line.rfind(" ", 0, limit)
+                cut = cut if cut > 0 else limit
+                if lines:
+                    yield lines
+                    lines, size = [], 0
+                yield [line[:cut]]
+                line = line[cut:].lstrip()
+            if lines and size + len(line) > limit:
+                yield lines
+                lines, size = [], 0
+            lines.append(line)
+            size += len(line)
+        if any(l.strip() for l in lines):
+            yield lines
+
+def write_pdf(r: Relatorio, logo_bytes: Optional[Logo], logo_width_cm: float, out: BinaryIO) -> None:
+    """Monta o PDF em `out` (qualquer arquivo binário gravável)."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage
+    from reportlab.lib.units import cm
+
+    doc = SimpleDocTemplate(out, pagesize=A4, leftMargin=2*cm, rightMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
+    styles = getSampleStyleSheet()
+    story = []
+
+    def p(markup: str, style="BodyText", space: float = 0.3):
+        story.append(Paragraph(markup, styles[style]))
+        if space:
+            story.append(Spacer(1, space*cm))
+
+    def text(value: str):
+        # Um flowable por parágrafo: o layout quebra páginas entre eles em tempo ~linear
+        chunks = list(_pdf_chunks(value)) or [["(preencher)"]]
+        for i, lines in enumerate(chunks):
+            p("<br/>".join(escape(l) for l in lines), space=0.3 if i == len(chunks) - 1 else 0.15)
+
+    if logo_bytes:
+        logo = prepare_logo(logo_bytes, logo_width_cm)
+        story.append(RLImage(io.BytesIO(logo.data), width=logo.width_cm*cm, height=logo.height_cm*cm))
+        story.append(Spacer(1, 0.4*cm))
+
+    p(f"<b>{escape(r.titulo)}</b>", "Title")
+    p(
+        f"Cliente: <b>{escape(r.cliente or '-')}</b><br/>"
+        f"Projeto: <b>{escape(r.projeto or '-')}</b><br/>"
+        f"Código: <b>{escape(r.codigo or '-')}</b><br/>"
+        f"Data: <b>{escape(r.data or '-')}</b><br/>"
+        f"Versão: <b>{escape(r.versao or '-')}</b>"
+    )
+
+    autores = "<br/>".join([escape(f"- {a.nome} ({a.cargo}) <{a.email}>") for a in r.autores if a.nome.strip()]) or "(preencher)"
+    p(f"<b>Autores</b><br/>{autores}")
+    p(f"<b>Aprovador</b><br/>{escape(r.aprovador or '(preencher)')}")
+
+    def sec(title, value):
+        p(f"<b>{title}</b>")
+        text(value)
+
+    def items(title, lines):
+        p(f"<b>{title}</b>", space=0)
+        for line in lines or ["(preencher)"]:
+            p(line, space=0)
+        story.append(Spacer(1, 0.3*cm))
+
+    sec("Resumo Executivo", r.resumo_exec)
+    sec("Escopo", r.escopo)
+    sec("Dados & Fontes", r.dados_fontes)
+    sec("Metodologia", r.metodologia)
+    sec("Resultados", r.resultados)
+    sec("Discussões", r.discussoes)
+    sec("Conclusões", r.conclusoes)
+    sec("Recomendações", r.recomendacoes)
+
+    items("Referências", [escape(f"- {x.referencia}").replace("\n", "<br/>") for x in r.referencias if x.referencia.strip()])
+    items("Anexos", [
+        f"- <b>{escape(a.titulo)}</b> – {escape(a.descricao)} {escape(f'({a.link})') if a.link else ''}"
+        f"{escape(f' [arquivo: {attachment_label(a)}]') if a.arquivo else ''}" for a in r.anexos if a.titulo.strip()
+    ])
+    for a, img in attachment_images(r):
+        p(f"<b>{escape(a.titulo or a.arquivo)}</b>", space=0.1)
+        story.append(RLImage(io.BytesIO(img.data), width=img.width_cm*cm, height=img.height_cm*cm))
+        story.append(Spacer(1, 0.4*cm))
+
+    if r.observacoes:
+        sec("Observações", r.observacoes)
+
+    doc.build(story)
+
+def build_pdf(r: Relatorio, logo_bytes: Optional[Logo], logo_width_cm: float) -> bytes:
+    # O app guarda o resultado no cache e o envia: precisa dos bytes. Para gravar
+    # direto num arquivo, sem o PDF inteiro na memória, use `write_pdf`.
+    out = io.BytesIO()
+    write_pdf(r, logo_bytes, logo_width_cm, out)
+    return out.getvalue()
+
+def build_docx(r: Relatorio, logo_bytes: Optional[Logo], logo_width_cm: float) -> bytes:
+    from docx import Document
+    from docx.shared import Pt, Cm
+
+    doc = Document()
+    style = doc.styles["Normal"]
+    style.font.name = "Calibri"
+    style.font.size = Pt(11)
+
+    if logo_bytes:
+        section = doc.sections[0]
+        header = section.header
+        paragraph = header.paragraphs[0]
+        run = paragraph.add_run()
+        run.add_picture(io.BytesIO(prepare_logo(logo_bytes, logo_width_cm).data), width=Cm(logo_width_cm))
+
+    doc.add_heading(r.titulo or "Relatório Técnico", level=0)
+
+    meta = doc.add_paragraph()
+    meta.add_run("Cliente: ").bold = True; meta.add_run(r.cliente or "-")
+    meta.add_run("\nProjeto: ").bold = True; meta.add_run(r.projeto or "-")
+    meta.add_run("\nCódigo: ").bold = True; meta.add_run(r.codigo or "-")
+    meta.add_run("\nData: ").bold = True; meta.add_run(r.data or "-")
+    meta.add_run("\nVersão: ").bold = True; meta.add_run(r.versao or "-")
+
+    doc.add_heading("Autores", level=1)
+    for a in r.autores:
+        if a.nome.strip():
+            doc.add_paragraph(f"- {a.nome} ({a.cargo}) <{a.email}>")
+    doc.add_paragraph(f"Aprovador: {r.aprovador or '(preencher)'}")
+
+    def sec(title, text):
+        doc.add_heading(title, level=1)
+        doc.add_paragraph(text or "(preencher)")
+
+    sec("Resumo Executivo", r.resumo_exec)
+    sec("Escopo", r.escopo)
+    sec("Dados & Fontes", r.dados_fontes)
+    sec("Metodologia", r.metodologia)
+    sec("Resultados", r.resultados)
+    sec("Discussões", r.discussoes)
+    sec("Conclusões", r.conclusoes)
+    sec("Recomendações", r.recomendacoes)
+
+    doc.add_heading("Referências", level=1)
+    if r.referencias:
+        for x in r.referencias:
+            if x.referencia.strip():
+                doc.add_paragraph(f"- {x.referencia}")
+    else:
+        doc.add_paragraph("(preencher)")
+
+    doc.add_heading("Anexos", level=1)
+    if r.anexos:
+        for a in r.anexos:
+            if a.titulo.strip():
+                line = f"- {a.titulo} – {a.descricao}"
+                if a.link:
+                    line += f" ({a.link})"
+                if a.arquivo:
+                    line += f" [arquivo: {attachment_label(a)}]"
+                doc.add_paragraph(line)
+        for a, img in attachment_images(r):
+            doc.add_paragraph().add_run(a.titulo or a.arquivo).bold = True
+            doc.add_picture(io.BytesIO(img.data), width=Cm(img.width_cm))
+    else:
+        doc.add_paragraph("(preencher)")
+
+    if r.observacoes:
+        sec("Observações", r.observacoes)
+
+    bio = io.BytesIO()
+    doc.save(bio)
+    return bio.getvalue()
+
+# ===================== Cache de renderização =====================
+class RenderCache:
+    """Cache LRU endereçado por conteúdo (compartilhado entre sessões).
+
+    As chaves são hashes estáveis do conteúdo do relatório; os valores são os
+    bytes renderizados. O tamanho total é limitado por ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return  # maior que o orçamento inteiro: não vale a pena guardar
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._items[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def lookup(self, key: str) -> Optional[bytes]:
+        """Como ``get``, mas contabiliza acerto/falta nas estatísticas."""
+        data = self.get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def get_or_render(self, key: str, render: Callable[[], bytes]) -> bytes:
+        data = self.lookup(key)
+        if data is None:
+            data = render()  # fora do lock: renders diferentes podem rodar em paralelo
+            self.put(key, data)
+        return data
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            return key in self._items
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._items),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+def report_fingerprint(r: Relatorio) -> str:
+    """Hash estável do conteúdo do relatório (independe da ordem das chaves)."""
+    payload = json.dumps(r.model_dump(), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def render_key(fmt: str, r: Relatorio, logo_bytes: Optional[bytes] = None, logo_width_cm: float = 3.5,
+               fingerprint: Optional[str] = None) -> str:
+    """`fingerprint` evita recalcular ``report_fingerprint(r)`` quando quem chama já o tem."""
+    h = hashlib.sha256()
+    h.update(fmt.encode("utf-8"))
+    h.update((fingerprint or report_fingerprint(r)).encode("ascii"))
+    if fmt != "md":  # o Markdown não usa logo
+        h.update(hashlib.sha256(logo_bytes).digest() if logo_bytes else b"-")
+        h.update(repr(float(logo_width_cm)).encode("ascii"))
+    return h.hexdigest()
+
+# ===================== Pipeline paralelo =====================
+EXPORT_MIMES = {
+    "md": "text/markdown",
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+DEFAULT_TIMEOUTS = {"md": 10.0, "pdf": 120.0, "docx": 120.0}
+
+@dataclass
+class ExportResult:
+    fmt: str
+    data: Optional[bytes] = None
+    error: str = ""
+    elapsed: float = 0.0
+    cached: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.data is not None
+
+def render_format(fmt: str, r: Relatorio, logo_bytes: Optional[Logo], logo_width_cm: float) -> bytes:
+    """Renderiza um formato. Função de módulo para poder rodar num processo filho."""
+    if fmt == "md":
+        return to_markdown(r).encode("utf-8")
+    if fmt == "pdf":
+        return build_pdf(r, logo_bytes, logo_width_cm)
+    if fmt == "docx":
+        return build_docx(r, logo_bytes, logo_width_cm)
+    raise ValueError(f"Formato desconhecido: {fmt}")
+
+def _timed_render(fmt: str, r: Relatorio, logo_bytes: Optional[Logo], logo_width_cm: float) -> Tuple[bytes, float]:
+    t0 = time.perf_counter()
+    data = render_format(fmt, r, logo_bytes, logo_width_cm)
+    return data, time.perf_counter() - t0
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_spawn_lock = threading.Lock()
+
+@contextmanager
+def _main_hidden() -> Iterator[None]:
+    """Esconde ``__main__.__file__``/``__spec__`` enquanto processos são criados.
+
+    O ``spawn`` reimporta o ``__main__`` do pai em cada filho; sob ``streamlit run``
+    ele é o app.py, que rodaria a página inteira (secrets, store, fila de jobs) em
+    cada worker. Sem esses atributos o filho só importa este módulo, pelo nome.
+    """
+    main = sys.modules.get("__main__")
+    with _spawn_lock:
+        if main is None:
+            yield
+            return
+        missing = object()
+        saved_file = main.__dict__.pop("__file__", missing)
+        saved_spec = getattr(main, "__spec__", None)
+        main.__spec__ = None
+        try:
+            yield
+        finally:
+            main.__spec__ = saved_spec
+            if saved_file is not missing:
+                main.__file__ = saved_file
+
+def get_export_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """Pool de processos do processo inteiro (reportlab segura o GIL).
+
+    Usa ``spawn``: fazer fork de um servidor Streamlit com várias threads não é seguro.
+    Os workers nascem sob demanda em ``submit``; envie tarefas por `_submit`.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = max_workers or min(3, os.cpu_count() or 1)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+        return _pool
+
+# Tarefas em voo por pool (de todas as sessões), para aposentar um pool sem cancelá-las
+_inflight: "weakref.WeakKeyDictionary[ProcessPoolExecutor, Set[Future]]" = weakref.WeakKeyDictionary()
+
+def _submit(pool: ProcessPoolExecutor, fn: Callable, *args) -> Future:
+    with _main_hidden():
+        fut = pool.submit(fn, *args)
+    with _pool_lock:
+        _inflight.setdefault(pool, set()).add(fut)
+    fut.add_done_callback(lambda f: _forget(pool, f))
+    return fut
+
+def _forget(pool: ProcessPoolExecutor, fut: Future) -> None:
+    with _pool_lock:
+        _inflight.get(pool, set()).discard(fut)
+
+def _retire_pool(pool: ProcessPoolExecutor, hung: Collection[Future] = (), grace: float = 120.0) -> None:
+    """Tira `pool` de uso; o próximo `get_export_pool` cria outro.
+
+    Nada é cancelado: as tarefas de outras sessões continuam nos workers antigos.
+    Quando terminam (ou após `grace` s), os processos que sobraram, presos nas
+    tarefas de `hung`, são encerrados, em vez de ficarem vivos para sempre.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+    def reap() -> None:
+        with _pool_lock:
+            others = [f for f in _inflight.get(pool, ()) if f not in hung]
+        wait(others, timeout=grace)
+        procs = list((getattr(pool, "_processes", None) or {}).values())  # sem API pública para os workers
+        pool.shutdown(wait=False)
+        for p in procs:
+            p.join(timeout=1.0)  # workers ociosos saem sozinhos após o shutdown
+            if p.is_alive():
+                p.terminate()
+
+    threading.Thread(target=reap, name="export-pool-reaper", daemon=True).start()
+
+def export_all(
+    r: Relatorio,
+    logo_bytes: Optional[bytes],
+    logo_width_cm: float,
+    formats: Iterable[str] = ("md", "pdf", "docx"),
+    timeouts: Optional[Dict[str, float]] = None,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> Dict[str, ExportResult]:
+    """Renderiza os formatos em paralelo, com timeout e erro isolados por formato.
+
+    O Markdown é barato e roda na própria thread enquanto PDF/DOCX rodam no pool.
+    Um formato que estoura o timeout é reportado como erro e o pool é aposentado
+    (`_retire_pool`): uma tarefa em execução não pode ser cancelada, e um render
+    travado prenderia o worker para todas as sessões.
+    """
+    timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+    formats = list(dict.fromkeys(formats))
+    results: Dict[str, ExportResult] = {}
+    t0 = time.perf_counter()
+
+    futures = {}
+    heavy = [f for f in formats if f != "md"]
+    logo: Optional[Logo] = logo_bytes
+    if logo_bytes and heavy:
+        # Preparado uma vez aqui: os workers de PDF e DOCX recebem só os bytes otimizados
+        try:
+            logo = prepare_logo(logo_bytes, logo_width_cm)
+        except Exception:
+            pass  # imagem inválida: cada formato reporta o erro
+    if heavy:
+        pool = pool or get_export_pool()
+        for fmt in heavy:
+            try:
+                futures[fmt] = _submit(pool, _timed_render, fmt, r, logo, logo_width_cm)
+            except (BrokenProcessPool, RuntimeError) as e:
+                results[fmt] = ExportResult(fmt, error=f"pool indisponível: {e}")
+
+    if "md" in formats:
+        try:
+            data, elapsed = _timed_render("md", r, logo_bytes, logo_width_cm)
+            results["md"] = ExportResult("md", data=data, elapsed=elapsed)
+        except Exception as e:
+            results["md"] = ExportResult("md", error=f"{type(e).__name__}: {e}")
+
+    broken = False
+    hung: List[Future] = []
+    for fmt, fut in futures.items():
+        remaining = max(0.0, t0 + timeouts.get(fmt, 120.0) - time.perf_counter())
+        try:
+            data, elapsed = fut.result(timeout=remaining)
+            results[fmt] = ExportResult(fmt, data=data, elapsed=elapsed)
+        except FutureTimeout:
+            if not fut.cancel():  # cancel() só falha se a tarefa já está rodando
+                hung.append(fut)
+            results[fmt] = ExportResult(fmt, error=f"timeout após {timeouts.get(fmt, 120.0):g}s")
+        except BrokenProcessPool as e:
+            broken = True
+            results[fmt] = ExportResult(fmt, error=f"processo de renderização morreu: {e}")
+        except Exception as e:
+            results[fmt] = ExportResult(fmt, error=f"{type(e).__name__}: {e}")
+    if (broken or hung) and pool is _pool:
+        _retire_pool(pool, hung, grace=max(timeouts.values()))  # próxima chamada cria um pool novo
+
+    return {fmt: results[fmt] for fmt in formats}
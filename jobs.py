@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Fila de jobs em segundo plano (autosave + exportação + upload), persistida em disco
+"""
+
+import os, json, time, uuid, threading, datetime as dt
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+QUEUED, RUNNING, DONE, FAILED, SUPERSEDED = "queued", "running", "done", "failed", "superseded"
+
+# handler(payload, blobs) -> resultado (dict serializável em JSON)
+JobHandler = Callable[[dict, Dict[str, bytes]], dict]
+
+class JobQueue:
+    """Fila de jobs com workers em threads e estado persistido em `root`.
+
+    Cada job é um ``<id>.json`` (e ``<id>.<nome>.bin`` para dados binários, ex.: logo).
+    Jobs que estavam na fila ou rodando quando o app parou voltam para a fila ao
+    reiniciar. Falhas são tentadas de novo com backoff até `max_attempts`.
+
+    Jobs com a mesma `key` (ex.: o id do rascunho) rodam um de cada vez, na ordem, e
+    um job novo substitui os anteriores ainda pendentes: uma nova tentativa de um
+    envio antigo nunca sobrescreve um envio mais recente.
+    """
+
+    def __init__(self, root: Path, handler: JobHandler, workers: int = 2, max_attempts: int = 3,
+                 backoff: float = 30.0, keep_finished: int = 200):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.handler = handler
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.keep_finished = keep_finished
+        self._cond = threading.Condition()
+        self._jobs: Dict[str, dict] = {}
+        self._load()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True) for i in range(max(1, workers))
+        ]
+        for t in self._threads:
+            t.start()
+
+    # ---------- API ----------
+    def submit(self, label: str, payload: dict, blobs: Optional[Dict[str, bytes]] = None, key: str = "") -> str:
+        job_id = f"{dt.datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+        for name, data in (blobs or {}).items():
+            (self.root / f"{job_id}.{name}.bin").write_bytes(data)
+        job = {
+            "id": job_id, "label": label, "key": key, "status": QUEUED, "attempts": 0, "max_attempts": self.max_attempts,
+            "created": _now(), "updated": _now(), "next_run": 0.0, "error": "",
+            "blobs": sorted((blobs or {}).keys()), "payload": payload, "result": {},
+        }
+        with self._cond:
+            if key:
+                self._supersede(key, job_id)
+            self._jobs[job_id] = job
+            self._save(job)
+            self._cond.notify()
+        return job_id
+
+    def supersede(self, key: str, by: str = "envio direto") -> None:
+        """Descarta os jobs pendentes de `key` (ex.: o mesmo rascunho foi enviado fora da fila)."""
+        with self._cond:
+            self._supersede(key, by)
+
+    def jobs(self, limit: int = 20) -> List[dict]:
+        """Os jobs mais recentes primeiro (cópias, sem o payload)."""
+        with self._cond:
+            items = sorted(self._jobs.values(), key=lambda j: j["created"], reverse=True)[:limit]
+            return [{k: v for k, v in j.items() if k != "payload"} for j in items]
+
+    def counts(self) -> Dict[str, int]:
+        with self._cond:
+            out = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0, SUPERSEDED: 0}
+            for j in self._jobs.values():
+                out[j["status"]] += 1
+            return out
+
+    def retry(self, job_id: str) -> None:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job and job["status"] == FAILED:
+                job.update(status=QUEUED, attempts=0, next_run=0.0, error="", updated=_now())
+                self._save(job)
+                self._cond.notify()
+
+    # ---------- internos ----------
+    def _supersede(self, key: str, by: str) -> None:
+        """Chamado com o lock. Um job rodando termina, mas não é tentado de novo."""
+        for job in self._jobs.values():
+            if job.get("key") != key or job["status"] not in (QUEUED, RUNNING, FAILED):
+                continue
+            job["superseded_by"] = by
+            if job["status"] != RUNNING:
+                self._finish_superseded(job)
+            self._save(job)
+
+    def _finish_superseded(self, job: dict) -> None:
+        job.update(status=SUPERSEDED, next_run=0.0, updated=_now(), error=f"substituído por {job['superseded_by']}")
+        self._drop_blobs(job)
+
+    def _drop_blobs(self, job: dict) -> None:
+        for name in job.get("blobs", []):  # entrada não é mais necessária
+            (self.root / f"{job['id']}.{name}.bin").unlink(missing_ok=True)
+        job["blobs"] = []
+
+    def _load(self) -> None:
+        for f in self.root.glob("*.json"):
+            try:
+                job = json.loads(f.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            if job.get("status") == RUNNING:  # interrompido por um restart
+                job["status"] = QUEUED
+            if job["status"] == QUEUED and job.get("superseded_by"):
+                self._finish_superseded(job)
+            self._jobs[job["id"]] = job
+
+    def _save(self, job: dict) -> None:
+        path = self.root / f"{job['id']}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(job, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def _next_job(self) -> Optional[dict]:
+        """Chamado com o lock: marca e devolve o job pronto mais antigo (ou espera)."""
+        now = time.time()
+        busy = {j.get("key") for j in self._jobs.values() if j["status"] == RUNNING and j.get("key")}
+        ready = [j for j in self._jobs.values() if j["status"] == QUEUED and j["next_run"] <= now and j.get("key") not in busy]
+        if ready:
+            job = min(ready, key=lambda j: j["created"])
+            job.update(status=RUNNING, attempts=job["attempts"] + 1, updated=_now())
+            self._save(job)
+            return job
+        # Jobs presos atrás de outro da mesma key acordam pelo notify_all do worker
+        pending = [j["next_run"] for j in self._jobs.values() if j["status"] == QUEUED and j.get("key") not in busy]
+        self._cond.wait(timeout=max(0.1, min(pending) - now) if pending else None)
+        return None
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                job = self._next_job()
+            if job is None:
+                continue
+            try:
+                blobs = {name: (self.root / f"{job['id']}.{name}.bin").read_bytes() for name in job.get("blobs", [])}
+                result, error = self.handler(job["payload"], blobs), ""
+            except Exception as e:
+                result, error = getattr(e, "result", {}), f"{type(e).__name__}: {e}"
+            with self._cond:
+                job.update(result=result or job.get("result", {}), error=error, updated=_now())
+                if not error:
+                    job["status"] = DONE
+                    self._drop_blobs(job)
+                elif job.get("superseded_by"):  # um envio mais novo do mesmo rascunho já está na fila
+                    self._finish_superseded(job)
+                    job["error"] = f"{error} ({job['error']})"
+                elif job["attempts"] < job["max_attempts"]:
+                    job["status"] = QUEUED
+                    job["next_run"] = time.time() + self.backoff * (2 ** (job["attempts"] - 1))
+                else:
+                    job["status"] = FAILED
+                self._save(job)
+                self._prune()
+                self._cond.notify_all()
+
+    def _prune(self) -> None:
+        finished = sorted((j for j in self._jobs.values() if j["status"] in (DONE, FAILED, SUPERSEDED)),
+                          key=lambda j: j["created"], reverse=True)
+        for job in finished[self.keep_finished:]:
+            self._jobs.pop(job["id"], None)
+            for f in self.root.glob(f"{job['id']}.*"):
+                f.unlink(missing_ok=True)
+
+class JobFailed(RuntimeError):
+    """Erro do handler que ainda carrega um resultado parcial para exibir."""
+
+    def __init__(self, message: str, result: dict):
+        super().__init__(message)
+        self.result = result
+
+def _now() -> str:
+    return dt.datetime.now().isoformat(timespec="milliseconds")
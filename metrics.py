@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Métricas por etapa (tempo, bytes, erros): log JSON rotativo e agregados no formato Prometheus
+"""
+
+import json, time, logging, threading, datetime as dt
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+PREFIX = "relatorio"
+QUANTILES = (0.5, 0.95)
+
+class Metrics:
+    """Registro de eventos por etapa, compartilhado pelo processo (UI e jobs).
+
+    Cada evento vai para um log JSON lines rotativo (se `log_path`), para a lista
+    da sessão que o gerou e para os agregados por (etapa, destino): contagem,
+    erros, bytes e as últimas `window` latências (para p50/p95).
+    """
+
+    def __init__(self, log_path: Optional[Path] = None, max_bytes: int = 5 * 1024 * 1024, backups: int = 3,
+                 window: int = 1000, session_events: int = 200, max_sessions: int = 100):
+        self.window = window
+        self.session_limit = session_events
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._stages: Dict[Tuple[str, str], dict] = {}
+        self._sessions: "OrderedDict[str, Deque[dict]]" = OrderedDict()
+        self._handler = None
+        if log_path:
+            Path(log_path).parent.mkdir(parents=True, exist_ok=True)
+            self._handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+            self._handler.setFormatter(logging.Formatter("%(message)s"))
+
+    # ---------- registro ----------
+    def record(self, stage: str, elapsed: float, bytes: int = 0, error: str = "", destination: str = "",
+               session: str = "", cached: bool = False, **extra: Any) -> dict:
+        """Registra uma etapa concluída. Acertos de cache (`cached`) vão para o log e a
+        sessão, mas não entram nas latências agregadas."""
+        event = {"ts": dt.datetime.now().isoformat(timespec="milliseconds"), "stage": stage,
+                 "destination": destination, "elapsed_s": round(elapsed, 6), "bytes": int(bytes),
+                 "error": error, "cached": cached, "session": session, **extra}
+        with self._lock:
+            if not cached:
+                agg = self._stages.setdefault((stage, destination), {
+                    "count": 0, "errors": 0, "bytes": 0, "seconds": 0.0, "latencies": deque(maxlen=self.window),
+                })
+                agg["count"] += 1
+                agg["errors"] += bool(error)
+                agg["bytes"] += int(bytes)
+                agg["seconds"] += elapsed
+                agg["latencies"].append(elapsed)
+            if session:
+                events = self._sessions.pop(session, None) or deque(maxlen=self.session_limit)
+                events.append(event)
+                self._sessions[session] = events
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+        if self._handler:
+            self._handler.handle(logging.makeLogRecord({"msg": json.dumps(event, ensure_ascii=False, default=str)}))
+        return event
+
+    @contextmanager
+    def timer(self, stage: str, destination: str = "", session: str = "", **extra: Any) -> Iterator[dict]:
+        """Mede o bloco; quem chama pode preencher ``ev["bytes"]``. Exceções são registradas e relançadas."""
+        ev: Dict[str, Any] = {"bytes": 0}
+        t0 = time.perf_counter()
+        try:
+            yield ev
+        except Exception as e:
+            self.record(stage, time.perf_counter() - t0, ev["bytes"], f"{type(e).__name__}: {e}", destination, session, **extra)
+            raise
+        self.record(stage, time.perf_counter() - t0, ev["bytes"], "", destination, session, **extra)
+
+    # ---------- leitura ----------
+    def session_events(self, session: str) -> List[dict]:
+        with self._lock:
+            return list(self._sessions.get(session, ()))
+
+    def summary(self) -> List[dict]:
+        """Uma linha por (etapa, destino): contagem, erros, bytes, p50/p95 (s)."""
+        with self._lock:
+            rows = [(key, dict(agg, latencies=sorted(agg["latencies"]))) for key, agg in sorted(self._stages.items())]
+        return [{"stage": stage, "destination": dest, "count": a["count"], "errors": a["errors"], "bytes": a["bytes"],
+                 "p50_s": _quantile(a["latencies"], 0.5), "p95_s": _quantile(a["latencies"], 0.95)}
+                for (stage, dest), a in rows]
+
+    def prometheus_text(self) -> str:
+        """Agregados no formato de exposição de texto do Prometheus."""
+        with self._lock:
+            rows = [(key, dict(agg, latencies=sorted(agg["latencies"]))) for key, agg in sorted(self._stages.items())]
+        lines = [
+            f"# HELP {PREFIX}_stage_duration_seconds Duração das etapas (quantis das últimas {self.window} execuções).",
+            f"# TYPE {PREFIX}_stage_duration_seconds summary",
+        ]
+        for (stage, dest), a in rows:
+            labels = _labels(stage=stage, destination=dest)
+            for q in QUANTILES:
+                lines.append(f'{PREFIX}_stage_duration_seconds{{{labels},quantile="{q}"}} {_quantile(a["latencies"], q):.6f}')
+            lines.append(f"{PREFIX}_stage_duration_seconds_sum{{{labels}}} {a['seconds']:.6f}")
+            lines.append(f"{PREFIX}_stage_duration_seconds_count{{{labels}}} {a['count']}")
+        for name, key, help_ in (("stage_bytes_total", "bytes", "Bytes produzidos/enviados por etapa."),
+                                 ("stage_errors_total", "errors", "Execuções com erro por etapa.")):
+            lines += [f"# HELP {PREFIX}_{name} {help_}", f"# TYPE {PREFIX}_{name} counter"]
+            lines += [f"{PREFIX}_{name}{{{_labels(stage=stage, destination=dest)}}} {a[key]}" for (stage, dest), a in rows]
+        return "\n".join(lines) + "\n"
+
+    def close(self) -> None:
+        if self._handler:
+            self._handler.close()
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def _labels(**labels: str) -> str:
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{k}="{esc(v)}"' for k, v in labels.items())
+
+# ===================== Endpoint /metrics =====================
+def serve_metrics(metrics: Metrics, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Sobe um servidor HTTP (thread daemon) com ``GET /metrics`` para o scraper do Prometheus.
+
+    Não há autenticação: por padrão só escuta no loopback; para outro host, use um
+    proxy reverso ou um firewall na frente.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):  # sem poluir o log do Streamlit
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
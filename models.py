@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Modelos do Relatório Técnico (pydantic, sem dependência de Streamlit)
+"""
+
+import datetime as dt
+from typing import List
+
+from pydantic import BaseModel, Field
+
+# ===================== Modelos =====================
+class Autor(BaseModel):
+    nome: str = ""
+    cargo: str = ""
+    email: str = ""
+
+class Referencia(BaseModel):
+    referencia: str = ""
+
+class Anexo(BaseModel):
+    titulo: str = ""
+    descricao: str = ""
+    link: str = ""
+    # Arquivo anexado (opcional): o conteúdo fica no AttachmentStore, endereçado por sha256
+    arquivo: str = ""
+    sha256: str = ""
+    tamanho: int = 0
+    mime: str = ""
+
+class Relatorio(BaseModel):
+    # Metadados
+    titulo: str = "Relatório Técnico"
+    cliente: str = ""
+    projeto: str = ""
+    codigo: str = ""  # será preenchido pelo gerador (opcional)
+    data: str = dt.date.today().isoformat()
+    versao: str = "1.0"
+    # Equipe
+    autores: List[Autor] = Field(default_factory=lambda: [Autor()])
+    aprovador: str = ""
+    # Corpo
+    resumo_exec: str = ""
+    escopo: str = ""
+    dados_fontes: str = ""
+    metodologia: str = ""
+    resultados: str = ""
+    discussoes: str = ""
+    conclusoes: str = ""
+    recomendacoes: str = ""
+    # Outros
+    referencias: List[Referencia] = Field(default_factory=list)
+    anexos: List[Anexo] = Field(default_factory=list)
+    observacoes: str = ""